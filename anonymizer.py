@@ -1,34 +1,115 @@
 import ast
 import json
+import math
 import logging
 import datetime
+import traceback
 from typing import Dict, Any
-import random
-import hashlib
 import re
-from collections import OrderedDict
+from collections import defaultdict
 
 import db_utils
-from comprehend import generate_fake_entities, detect_pii_data, anonymize, de_anonymize, generate_fake_data
-from db_methods import get_piimaster_uuid, get_piientity_data, bulk_insert_piientity, insert_piidata
-from audit_logger import AuditLogger  # New module for HIPAA compliance
+from comprehend import generate_fake_entities, detect_pii_data, prefetch_pii_data, anonymize, de_anonymize, generate_fake_data
+from db_methods import get_piimaster_uuid, get_piientity_data, bulk_insert_piientity, insert_piidata, save_anonymization
+from audit_logger import AsyncAuditLogger  # New module for HIPAA compliance
+
+try:
+    import orjson  # Optional: much faster JSON encoding/decoding
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 # Initialize audit logger for HIPAA compliance
-audit_logger = AuditLogger()
+audit_logger = AsyncAuditLogger()
 
 session = db_utils.get_db_session()
 
-# DEBUG MODE - Set to False in production
-DEBUG_MODE = True
+# DEBUG MODE - prints PHI to stdout; enable only for local troubleshooting
+DEBUG_MODE = False
+
+# ISO (YYYY-MM-DD), numeric (DD/MM/YYYY or MM/DD/YYYY) and DD/Mon/YYYY dates
+_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$|^(\d{2})/(\d{2})/(\d{4})$|^(\d{2})/([A-Za-z]{3})/(\d{4})$')
+
+# Four-digit year anywhere in a date of birth
+_DOB_YEAR_RE = re.compile(r'\b(\d{4})\b')
+
+# Any letter or digit
+_ALNUM_RE = re.compile(r'[^\W_]')
+
+# 3-digit ZIP prefixes with 20,000 or fewer residents; HIPAA Safe Harbor requires 000
+_RESTRICTED_ZIP3 = frozenset({
+    '036', '692', '878', '059', '790', '879', '063', '821', '884',
+    '102', '823', '890', '203', '830', '893', '556', '831'
+})
 
+# Fake types that mask a value rather than replace it (many originals share
+# one fake), so they are never restored from inside longer strings
+_MASK_FAKE_TYPES = frozenset({'HIPAA_Date_Handler', 'HIPAA_ZIP_Handler', 'generic'})
 
-def log_phi_access(masterid: str, action: str, data_type: str, user_context: Dict[str, Any] = None):
+# Processing purposes accepted by validate_gdpr_consent
+_VALID_GDPR_PURPOSES = frozenset({'healthcare_provision', 'emergency_care', 'quality_improvement'})
+
+# Profile fields whose value goes through standard PII detection
+_PROFILE_ID_KEY_RE = re.compile('phone|email|ssn|mrn|insurance')
+
+
+def _json_dumps(obj, finite=False):
+    """
+    Serialize to a JSON string, preserving key order (orjson when available).
+    Pass finite=True when the tree is known to hold no NaN or Infinity
+    (e.g. it was parsed by orjson), to skip the check for them.
+    """
+    # orjson writes NaN and Infinity as null; the stdlib keeps them
+    if orjson is not None and (finite or not _has_non_finite_float(obj)):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits - let the stdlib encoder handle it
+            pass
+    return json.dumps(obj)
+
+
+def _json_loads(data):
+    """Parse a JSON string into plain (insertion-ordered) dicts and lists"""
+    return _json_parse(data)[0]
+
+
+def _json_parse(data):
+    """
+    Parse a JSON string like _json_loads, also returning whether the result
+    is known to hold no NaN or Infinity (true when orjson parsed it).
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data), True
+        except orjson.JSONDecodeError:
+            # e.g. NaN or Infinity literals, which only the stdlib accepts
+            pass
+    return json.loads(data), False
+
+
+def _has_non_finite_float(obj):
+    """Check whether a JSON tree holds a NaN or infinite float anywhere"""
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, float):
+            if not math.isfinite(item):
+                return True
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return False
+
+
+def log_phi_access(masterid: str, action: str, data_type: str, user_context: Dict[str, Any] = None,
+                   timestamp: str = None):
     """Log PHI access for HIPAA audit requirements"""
     audit_logger.log_access({
-        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'timestamp': timestamp or datetime.datetime.utcnow().isoformat(),
         'masterid': masterid,
         'action': action,  # ANONYMIZE, DE-ANONYMIZE, VIEW, etc.
         'data_type': data_type,
@@ -41,12 +122,14 @@ def validate_gdpr_consent(identity: str, identityType: str, purpose: str) -> boo
     """Validate GDPR consent for data processing"""
     # In production, check consent database
     # For now, we'll assume consent is given for healthcare purposes
-    valid_purposes = ['healthcare_provision', 'emergency_care', 'quality_improvement']
-    return purpose in valid_purposes
+    # Purposes come from request JSON and may be unhashable; only strings can match
+    return isinstance(purpose, str) and purpose in _VALID_GDPR_PURPOSES
 
 
 def anonymizer(identity, identityType, conversation, context=None):
     """Enhanced anonymizer with HIPAA/GDPR compliance"""
+    # One timestamp per request, shared by the audit events
+    now_iso = datetime.datetime.utcnow().isoformat()
     try:
         # GDPR consent check
         if context and context.get('requires_consent'):
@@ -59,49 +142,49 @@ def anonymizer(identity, identityType, conversation, context=None):
         result = None
         # Detect PII and PHI
         entities = detect_pii_data(conversation)
+        entity_count = len(entities)
         
         # Log detection for audit
-        log_phi_access(identity, 'DETECT_PHI', 'conversation', context)
+        log_phi_access(identity, 'DETECT_PHI', 'conversation', context, timestamp=now_iso)
         
         if entities:
             # Get masterid
             masterid = get_piimaster_uuid(identity, identityType)
             
             # Log PHI processing
-            log_phi_access(masterid, 'ANONYMIZE', 'conversation', context)
+            log_phi_access(masterid, 'ANONYMIZE', 'conversation', context, timestamp=now_iso)
 
-            # Get PII Data stored for the User
-            rows = get_piientity_data(masterid)
+            # Get PII Data stored for the User - read uncached, since new
+            # mappings must reuse the fakes already stored
+            rows = get_piientity_data(masterid, use_cache=False)
 
             pii_entity_records = generate_fake_entities(masterid, entities, rows)
 
             result = anonymize(conversation, entities)
 
-            if pii_entity_records:
-                bulk_insert_piientity(pii_entity_records)
-
-            # Store anonymization record with GDPR metadata
+            # Store new mappings and the anonymization record with GDPR metadata
             metadata = {
                 'gdpr_purpose': context.get('purpose') if context else None,
                 'gdpr_legal_basis': 'Article 9(2)(h)' if context else None,
-                'entity_count': len(entities),
-                'entity_types': list(set(e['Type'] for e in entities))
+                'entity_count': entity_count,
+                'entity_types': list({e['Type'] for e in entities})
             }
-            insert_piidata(masterid, conversation, result, 'ANONYMIZE', metadata=json.dumps(metadata))
+            save_anonymization(pii_entity_records, masterid, conversation, result, 'ANONYMIZE',
+                               metadata=_json_dumps(metadata))
 
             # Log successful anonymization
             audit_logger.log_success({
                 'masterid': masterid,
                 'action': 'ANONYMIZE',
-                'entities_processed': len(entities),
-                'timestamp': datetime.datetime.utcnow().isoformat()
+                'entities_processed': entity_count,
+                'timestamp': now_iso
             })
 
         return {
             "statusCode": 200,
-            "body": json.dumps({
+            "body": _json_dumps({
                 "result": result if result else conversation,
-                "entities_detected": len(entities) if entities else 0,
+                "entities_detected": entity_count,
                 "compliance": {
                     "hipaa_safe_harbor": True,
                     "gdpr_pseudonymized": True
@@ -113,7 +196,7 @@ def anonymizer(identity, identityType, conversation, context=None):
         audit_logger.log_error({
             'action': 'ANONYMIZE',
             'error': str(e),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
         return {
             "statusCode": 500,
@@ -121,100 +204,127 @@ def anonymizer(identity, identityType, conversation, context=None):
         }
 
 
-def if_exists(records, pii_type, pii_data):
-    """Check if PII data already has a fake equivalent"""
+def build_pii_index(records):
+    """
+    Bucket PII records as {PIITYPE: {ORIGINALDATA: fakeData}} for O(1) lookups.
+    Type and value are matched case-insensitively; the first record for a key wins.
+    """
+    index = defaultdict(dict)
     for record in records:
-        if record['piiType'].upper() == pii_type.upper() and record['originalData'].upper() == pii_data.upper():
-            return record['fakeData']
-    return None
+        _index_record(index, record)
+    return index
+
+
+def _index_record(index, record):
+    """Add a single PII record to an index built by build_pii_index"""
+    index[record['piiType'].upper()].setdefault(record['originalData'].upper(), record['fakeData'])
+
+
+def if_exists_indexed(index, pii_type, pii_data):
+    """Look up the fake for a PII value, or None if there is none"""
+    bucket = index.get(pii_type.upper())
+    if bucket is None:
+        return None
+    return bucket.get(pii_data.upper())
 
 
 def anonymize_profile(identity, identityType, profile, context=None):
     """Enhanced profile anonymization - only anonymizes HIPAA identifiers"""
-    print(f'Profile {type(profile)} - {profile}')
+    # One timestamp per request, shared by the audit events
+    now_iso = datetime.datetime.utcnow().isoformat()
+    if DEBUG_MODE:
+        print(f'[DEBUG] Profile {type(profile)} - {profile}')
     try:
         masterid = get_piimaster_uuid(identity, identityType)
         
         # Log profile access
-        log_phi_access(masterid, 'ANONYMIZE_PROFILE', 'profile', context)
+        log_phi_access(masterid, 'ANONYMIZE_PROFILE', 'profile', context, timestamp=now_iso)
 
-        # Get PII Data stored for the User
-        rows = get_piientity_data(masterid)
+        # Get PII Data stored for the User - read uncached, since new
+        # mappings must reuse the fakes already stored
+        rows = get_piientity_data(masterid, use_cache=False)
+        rows_index = build_pii_index(rows)
 
         anon_profile = {}
         records = []
+        records_index = build_pii_index(records)
+        
+        # Run the per-field detection calls concurrently up front
+        prefetch_pii_data(_profile_detection_texts(profile))
         
         for key, value in profile.items():
             fake_data = None
             if value != '' and value is not None:
+                key_lower = key.lower()
+                value_str = str(value)
                 # Check for HIPAA identifiers in profile keys
-                if 'dob' in key.lower() or 'date of birth' in key.lower():
+                if 'dob' in key_lower or 'date of birth' in key_lower:
                     # HIPAA compliant date handling
-                    fake_data = if_exists(rows, key, str(value))
+                    fake_data = if_exists_indexed(rows_index, key, value_str)
                     if fake_data is None:
-                        fake_data = if_exists(records, 'DOB', str(value))
+                        fake_data = if_exists_indexed(records_index, 'DOB', value_str)
                         if fake_data is None:
                             # Keep only year for HIPAA compliance
-                            try:
-                                year = str(value).split('/')[-1]
-                                fake_data = 'XX/XX/' + year
-                            except:
-                                fake_data = 'XX/XX/XXXX'
+                            year = _DOB_YEAR_RE.search(value_str)
+                            fake_data = 'XX/XX/' + year.group(1) if year else 'XX/XX/XXXX'
                             records.append({
                                 'uuid': masterid,
                                 'piiType': 'DOB',
-                                'originalData': str(value),
+                                'originalData': value_str,
                                 'fakeDataType': 'HIPAA_Date_Handler',
                                 'fakeData': fake_data
                             })
-                elif 'zip' in key.lower():
+                            _index_record(records_index, records[-1])
+                elif 'zip' in key_lower:
                     # HIPAA compliant ZIP handling
-                    fake_data = if_exists(rows, key, str(value))
+                    fake_data = if_exists_indexed(rows_index, key, value_str)
                     if fake_data is None:
-                        fake_data = if_exists(records, 'ZIP', str(value))
+                        fake_data = if_exists_indexed(records_index, 'ZIP', value_str)
                         if fake_data is None:
                             # Check if ZIP is in restricted list
-                            restricted_zips = ['036', '692', '878', '059', '790', '879', '063', '821', '884', '102', '823', '890', '203', '830', '893', '556', '831']
-                            if str(value)[:3] in restricted_zips:
+                            if value_str[:3] in _RESTRICTED_ZIP3:
                                 fake_data = '00000'
                             else:
-                                fake_data = str(value)[:3] + '**'
+                                fake_data = value_str[:3] + '**'
                             records.append({
                                 'uuid': masterid,
                                 'piiType': 'ZIP',
-                                'originalData': str(value),
+                                'originalData': value_str,
                                 'fakeDataType': 'HIPAA_ZIP_Handler',
                                 'fakeData': fake_data
                             })
-                elif 'first name' in key.lower() or 'last name' in key.lower() or key.lower() == 'name':
+                            _index_record(records_index, records[-1])
+                elif 'first name' in key_lower or 'last name' in key_lower or key_lower == 'name':
                     # Check if this is a provider name
-                    if 'provider' not in key.lower() and 'doctor' not in key.lower() and 'physician' not in key.lower():
-                        fake_data = if_exists(rows, 'NAME', str(value))
+                    if 'provider' not in key_lower and 'doctor' not in key_lower and 'physician' not in key_lower:
+                        fake_data = if_exists_indexed(rows_index, 'NAME', value_str)
                         if fake_data is None:
-                            fake_data = if_exists(records, 'NAME', str(value))
+                            fake_data = if_exists_indexed(records_index, 'NAME', value_str)
                             if fake_data is None:
-                                fake_data_generator_name, fake_data = generate_fake_data('NAME')
-                                if 'first name' in key.lower():
-                                    tokens = fake_data.split(' ')
-                                    fake_data = tokens[0]
-                                elif 'last name' in key.lower():
-                                    tokens = fake_data.split(' ')
-                                    fake_data = tokens[1] if len(tokens) > 1 else tokens[0]
+                                # Generate just the part of the name the field holds
+                                if 'first name' in key_lower:
+                                    name_type = 'FIRST_NAME'
+                                elif 'last name' in key_lower:
+                                    name_type = 'LAST_NAME'
+                                else:
+                                    name_type = 'NAME'
+                                fake_data_generator_name, fake_data = generate_fake_data(name_type)
                                 records.append({
                                     'uuid': masterid,
                                     'piiType': 'NAME',
-                                    'originalData': str(value),
+                                    'originalData': value_str,
                                     'fakeDataType': fake_data_generator_name,
                                     'fakeData': fake_data
                                 })
-                elif any(hipaa_key in key.lower() for hipaa_key in ['phone', 'email', 'ssn', 'mrn', 'insurance']):
+                                _index_record(records_index, records[-1])
+                elif _PROFILE_ID_KEY_RE.search(key_lower):
                     # Use standard PII detection
-                    entities = detect_pii_data(str(value))
+                    entities = detect_pii_data(value_str)
                     if entities:
                         entity = entities[0]
-                        fake_data = if_exists(rows, entity['Type'], str(entity['originalData']))
+                        fake_data = if_exists_indexed(rows_index, entity['Type'], str(entity['originalData']))
                         if fake_data is None:
-                            fake_data = if_exists(records, entity['Type'], str(entity['originalData']))
+                            fake_data = if_exists_indexed(records_index, entity['Type'], str(entity['originalData']))
                             if fake_data is None:
                                 fake_data_generator_name, fake_data = generate_fake_data(entity['Type'])
 
@@ -228,14 +338,15 @@ def anonymize_profile(identity, identityType, profile, context=None):
                                     'fakeDataType': fake_data_generator_name,
                                     'fakeData': fake_data
                                 })
+                                _index_record(records_index, records[-1])
                 else:
                     # For other fields, check if the value contains PII
-                    entities = detect_pii_data(str(value))
+                    entities = detect_pii_data(value_str)
                     if entities:
                         entity = entities[0]
-                        fake_data = if_exists(rows, entity['Type'], str(entity['originalData']))
+                        fake_data = if_exists_indexed(rows_index, entity['Type'], str(entity['originalData']))
                         if fake_data is None:
-                            fake_data = if_exists(records, entity['Type'], str(entity['originalData']))
+                            fake_data = if_exists_indexed(records_index, entity['Type'], str(entity['originalData']))
                             if fake_data is None:
                                 fake_data_generator_name, fake_data = generate_fake_data(entity['Type'])
                                 records.append({
@@ -245,6 +356,7 @@ def anonymize_profile(identity, identityType, profile, context=None):
                                     'fakeDataType': fake_data_generator_name,
                                     'fakeData': fake_data
                                 })
+                                _index_record(records_index, records[-1])
                     
             if fake_data is None:
                 fake_data = value
@@ -259,12 +371,12 @@ def anonymize_profile(identity, identityType, profile, context=None):
             'masterid': masterid,
             'action': 'ANONYMIZE_PROFILE',
             'fields_processed': len(anon_profile),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
 
         result = {
             "statusCode": 200,
-            "body": json.dumps({
+            "body": _json_dumps({
                 "result": str(anon_profile),
                 "compliance": {
                     "hipaa_safe_harbor": True,
@@ -272,7 +384,8 @@ def anonymize_profile(identity, identityType, profile, context=None):
                 }
             })
         }
-        print(f'Result {result}')
+        if DEBUG_MODE:
+            print(f'[DEBUG] Result {result}')
         return result
 
     except Exception as e:
@@ -280,7 +393,7 @@ def anonymize_profile(identity, identityType, profile, context=None):
         audit_logger.log_error({
             'action': 'ANONYMIZE_PROFILE',
             'error': str(e),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
         return {
             "statusCode": 500,
@@ -290,12 +403,14 @@ def anonymize_profile(identity, identityType, profile, context=None):
 
 def de_anonymize_profile(identity, identityType, profile, context=None):
     """De-anonymize profile with audit logging"""
+    # One timestamp per request, shared by the audit events
+    now_iso = datetime.datetime.utcnow().isoformat()
     try:
         result = None
         masterid = get_piimaster_uuid(identity, identityType, insert=False)
         
         # Log de-anonymization attempt
-        log_phi_access(masterid, 'DE_ANONYMIZE_PROFILE', 'profile', context)
+        log_phi_access(masterid, 'DE_ANONYMIZE_PROFILE', 'profile', context, timestamp=now_iso)
 
         # Get PII Data stored for the User
         rows = get_piientity_data(masterid)
@@ -311,12 +426,12 @@ def de_anonymize_profile(identity, identityType, profile, context=None):
             'masterid': masterid,
             'action': 'DE_ANONYMIZE_PROFILE',
             'fields_processed': len(deanon_profile),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
 
         return {
             "statusCode": 200,
-            "body": json.dumps({
+            "body": _json_dumps({
                 "result": str(deanon_profile)
             })
         }
@@ -326,7 +441,7 @@ def de_anonymize_profile(identity, identityType, profile, context=None):
         audit_logger.log_error({
             'action': 'DE_ANONYMIZE_PROFILE',
             'error': str(e),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
         return {
             "statusCode": 500,
@@ -338,6 +453,8 @@ def de_anonymizer(identity, identityType, conversation, context=None):
     """
     De-anonymizes a given conversation for a specific identity with HIPAA/GDPR compliance.
     """
+    # One timestamp per request, shared by the audit events
+    now_iso = datetime.datetime.utcnow().isoformat()
     try:
         # GDPR access control check
         if context and context.get('requires_authorization'):
@@ -348,7 +465,7 @@ def de_anonymizer(identity, identityType, conversation, context=None):
         masterid = get_piimaster_uuid(identity, identityType, insert=False)
         
         # Log de-anonymization access
-        log_phi_access(masterid, 'DE_ANONYMIZE', 'conversation', context)
+        log_phi_access(masterid, 'DE_ANONYMIZE', 'conversation', context, timestamp=now_iso)
 
         # Get PII Data stored for the User
         rows = get_piientity_data(masterid)
@@ -361,21 +478,21 @@ def de_anonymizer(identity, identityType, conversation, context=None):
             metadata = {
                 'gdpr_access_reason': context.get('access_reason') if context else None,
                 'gdpr_authorized_by': context.get('authorized_by') if context else None,
-                'timestamp': datetime.datetime.utcnow().isoformat()
+                'timestamp': now_iso
             }
-            insert_piidata(masterid, result, conversation, 'DE-ANONYMIZE', metadata=json.dumps(metadata))
+            insert_piidata(masterid, result, conversation, 'DE-ANONYMIZE', metadata=_json_dumps(metadata))
             
             # Log successful de-anonymization
             audit_logger.log_success({
                 'masterid': masterid,
                 'action': 'DE_ANONYMIZE',
                 'entities_restored': len(rows),
-                'timestamp': datetime.datetime.utcnow().isoformat()
+                'timestamp': now_iso
             })
 
         return {
             "statusCode": 200,
-            "body": json.dumps({
+            "body": _json_dumps({
                 "result": result if result else conversation,
                 "entities_restored": len(rows) if rows else 0
             })
@@ -385,7 +502,7 @@ def de_anonymizer(identity, identityType, conversation, context=None):
         audit_logger.log_error({
             'action': 'DE_ANONYMIZE',
             'error': str(e),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
         return {
             "statusCode": 500,
@@ -393,19 +510,22 @@ def de_anonymizer(identity, identityType, conversation, context=None):
         }
 
 
-def anonymize_json_simple(identity, identityType, json_data, context=None):
+def anonymize_json_simple(identity, identityType, json_data, context=None, finite=False):
     """
     Simple JSON anonymization that preserves structure and order.
     Only anonymizes HIPAA identifiers, preserves medical information.
+    Callers passing an already-parsed tree with no NaN or Infinity in it
+    (e.g. decoded by orjson) can set finite to skip the check on serializing.
     """
+    # One timestamp per request, shared by the audit events
+    now_iso = datetime.datetime.utcnow().isoformat()
     try:
         if DEBUG_MODE:
             print(f"[DEBUG] Starting simple anonymization for identity: {identity}")
         
         # Parse JSON preserving order
         if isinstance(json_data, str):
-            # Use object_pairs_hook to preserve order
-            data = json.loads(json_data, object_pairs_hook=OrderedDict)
+            data, finite = _json_parse(json_data)
         else:
             data = json_data
             
@@ -417,76 +537,64 @@ def anonymize_json_simple(identity, identityType, json_data, context=None):
             print(f"[DEBUG] Master ID: {masterid}")
         
         # Log JSON anonymization
-        log_phi_access(masterid, 'ANONYMIZE_JSON', 'json_data', context)
+        log_phi_access(masterid, 'ANONYMIZE_JSON', 'json_data', context, timestamp=now_iso)
         
-        # Get existing PII data for user
-        rows = get_piientity_data(masterid)
+        # Get existing PII data for user - read uncached, since new
+        # mappings must reuse the fakes already stored
+        rows = get_piientity_data(masterid, use_cache=False)
         if DEBUG_MODE:
             print(f"[DEBUG] Existing rows count: {len(rows) if rows else 0}")
         
-        # Recursively anonymize the JSON while preserving structure and order
-        anonymized_data, records = _anonymize_json_recursive_ordered(data, masterid, rows)
+        # Issue the detector calls for all string values concurrently up front;
+        # the recursion below then reads them from the detection cache
+        prefetch_pii_data(_collect_detection_texts(data))
+        
+        # Recursively anonymize the JSON while preserving structure and order.
+        # Records are deduplicated as they are created, via the records index.
+        anonymized_data, records = _anonymize_json_recursive_ordered(data, masterid, build_pii_index(rows))
         
         if DEBUG_MODE:
             print(f"[DEBUG] Anonymization complete. Records created: {len(records)}")
             if records:
-                print(f"[DEBUG] Sample records:")
+                print("[DEBUG] Sample records:")
                 for record in records[:5]:
                     print(f"  - {record['piiType']}: '{record['originalData']}' -> '{record['fakeData']}'")
         
-        # Deduplicate records
-        unique_records = []
-        seen = set()
-        for record in records:
-            key = (record['uuid'], record['piiType'], record['originalData'])
-            if key not in seen:
-                seen.add(key)
-                unique_records.append(record)
-        
-        if DEBUG_MODE:
-            print(f"[DEBUG] Unique records to insert: {len(unique_records)}")
-        
-        if unique_records:
-            bulk_insert_piientity(unique_records)
-            
-        # Store anonymization record - preserve order in JSON
+        # Store new mappings and the anonymization record - preserve order in JSON
         metadata = {
             'gdpr_purpose': context.get('purpose') if context else None,
             'gdpr_legal_basis': 'Article 9(2)(h)' if context else None,
-            'entities_processed': len(unique_records),
+            'entities_processed': len(records),
             'data_type': 'json_simple'
         }
         
-        # Use json.dumps with sort_keys=False to preserve order
-        original_json = json.dumps(data, sort_keys=False)
-        anonymized_json = json.dumps(anonymized_data, sort_keys=False)
+        # Key order is preserved by both orjson and the stdlib fallback.
+        # A payload that arrived as a string is stored as received.
+        # Anonymization only rewrites strings, so floats are as in the input.
+        original_json = json_data if isinstance(json_data, str) else _json_dumps(data, finite)
+        anonymized_json = _json_dumps(anonymized_data, finite)
         
-        insert_piidata(masterid, original_json, anonymized_json, 
-                      'ANONYMIZE_JSON_SIMPLE', metadata=json.dumps(metadata))
+        save_anonymization(records, masterid, original_json, anonymized_json,
+                           'ANONYMIZE_JSON_SIMPLE', metadata=_json_dumps(metadata))
         
         # Log success
         audit_logger.log_success({
             'masterid': masterid,
             'action': 'ANONYMIZE_JSON_SIMPLE',
-            'entities_processed': len(unique_records),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'entities_processed': len(records),
+            'timestamp': now_iso
         })
         
+        # Reuse the serialized result rather than encoding the tree a second time
         return {
             "statusCode": 200,
-            "body": json.dumps({
-                "result": anonymized_data,
-                "entities_detected": len(unique_records),
-                "compliance": {
-                    "hipaa_safe_harbor": True,
-                    "gdpr_pseudonymized": True,
-                    "structure_preserved": True
-                }
-            }, sort_keys=False)  # Preserve order in response
+            "body": '{"result": ' + anonymized_json
+                    + ', "entities_detected": ' + str(len(records))
+                    + ', "compliance": {"hipaa_safe_harbor": true, "gdpr_pseudonymized": true,'
+                    + ' "structure_preserved": true}}'
         }
         
     except Exception as e:
-        import traceback
         if DEBUG_MODE:
             print(f"[DEBUG] Error in anonymize_json_simple: {str(e)}")
             print(f"[DEBUG] Traceback: {traceback.format_exc()}")
@@ -494,7 +602,7 @@ def anonymize_json_simple(identity, identityType, json_data, context=None):
         audit_logger.log_error({
             'action': 'ANONYMIZE_JSON_SIMPLE',
             'error': str(e),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
         return {
             "statusCode": 500,
@@ -502,273 +610,208 @@ def anonymize_json_simple(identity, identityType, json_data, context=None):
         }
 
 
-def _anonymize_json_recursive_ordered(data, masterid, existing_rows, records=None):
+def _anonymize_json_recursive_ordered(data, masterid, existing_index, records=None, records_index=None):
     """
-    Recursively anonymize JSON data while preserving structure and order.
+    Anonymize JSON data while preserving structure and order.
     Only anonymizes HIPAA identifiers, preserves medical information.
+    Walks the tree with an explicit stack, so deeply nested payloads
+    neither pay per-level call overhead nor hit the recursion limit.
+    existing_index and records_index are lookups built with build_pii_index;
+    every new mapping is appended to records and added to records_index.
     """
     if records is None:
         records = []
-        
-    if isinstance(data, (dict, OrderedDict)):
-        # Use OrderedDict to preserve order
-        anonymized = OrderedDict()
-        for key, value in data.items():
-            # Check if this key might contain HIPAA identifiers
-            if should_anonymize_key(key):
-                anonymized[key], new_records = _anonymize_value_comprehensive(
-                    key, value, masterid, existing_rows, records
-                )
-                records.extend(new_records)
+    if records_index is None:
+        records_index = build_pii_index(records)
+
+    if not isinstance(data, (dict, list)):
+        return _anonymize_scalar(data, masterid, existing_index, records, records_index), records
+
+    # Each frame holds an iterator over a container's items, so values are
+    # visited depth-first in document order (fakes are assigned in that order)
+    anonymized = {} if isinstance(data, dict) else []
+    stack = [(iter(data.items()) if isinstance(data, dict) else enumerate(data), anonymized)]
+    while stack:
+        items, target = stack[-1]
+        in_object = isinstance(target, dict)
+        for key, value in items:
+            child = None
+            if isinstance(value, dict):
+                new_value = {}
+                child = (iter(value.items()), new_value)
+            elif isinstance(value, list):
+                new_value = []
+                child = (enumerate(value), new_value)
             else:
-                # Still check nested structures and string values for PII
-                if isinstance(value, str):
-                    # Check if the string contains PII
-                    entities = detect_pii_data(value)
-                    if entities:
-                        anonymized[key], new_records = _anonymize_value_comprehensive(
-                            key, value, masterid, existing_rows, records
-                        )
-                        records.extend(new_records)
-                    else:
-                        anonymized[key] = value
-                else:
-                    # Recurse for nested structures
-                    anonymized[key], _ = _anonymize_json_recursive_ordered(
-                        value, masterid, existing_rows, records
-                    )
-        return anonymized, records
-        
-    elif isinstance(data, list):
-        anonymized = []
-        for item in data:
-            anon_item, _ = _anonymize_json_recursive_ordered(
-                item, masterid, existing_rows, records
-            )
-            anonymized.append(anon_item)
-        return anonymized, records
-        
-    else:
-        # Check scalar values for PII
-        return _anonymize_scalar_value(data, masterid, existing_rows, records)
-
-
-def _anonymize_value_comprehensive(key, value, masterid, existing_rows, records):
-    """
-    Anonymize a value based on detected PII.
-    Only anonymizes HIPAA identifiers.
-    """
-    if value is None or value == '':
-        return value, []
-        
-    new_records = []
-    
-    # Handle lists
-    if isinstance(value, list):
-        anonymized_list = []
-        for item in value:
-            if isinstance(item, (dict, OrderedDict)):
-                anon_item, _ = _anonymize_json_recursive_ordered(item, masterid, existing_rows, records)
-                anonymized_list.append(anon_item)
-            elif isinstance(item, str) and item:
-                # Check if the string contains PII
-                entities = detect_pii_data(item)
-                if entities:
-                    # Anonymize detected entities
-                    anonymized_item = item
-                    for entity in entities:
-                        fake_data = if_exists(existing_rows, entity['Type'], entity['originalData'])
-                        if not fake_data:
-                            fake_data = if_exists(records, entity['Type'], entity['originalData'])
-                            if not fake_data:
-                                generator_name, fake_data = generate_fake_data(entity['Type'])
-                                
-                                new_record = {
-                                    'uuid': masterid,
-                                    'piiType': entity['Type'],
-                                    'originalData': entity['originalData'],
-                                    'fakeDataType': generator_name,
-                                    'fakeData': fake_data
-                                }
-                                if not _record_exists(new_record, records):
-                                    new_records.append(new_record)
-                        
-                        anonymized_item = anonymized_item.replace(entity['originalData'], fake_data)
-                    
-                    anonymized_list.append(anonymized_item)
-                else:
-                    anonymized_list.append(item)
+                # Dates in object fields get HIPAA year-only handling
+                new_value = _anonymize_scalar(
+                    value, masterid, existing_index, records, records_index, hipaa_dates=in_object
+                )
+            
+            # Containers are attached before being filled, so order is preserved
+            if in_object:
+                target[key] = new_value
             else:
-                anonymized_list.append(item)
-        return anonymized_list, new_records
-    
-    # Handle nested objects
-    if isinstance(value, (dict, OrderedDict)):
-        return _anonymize_json_recursive_ordered(value, masterid, existing_rows, records)
-    
-    # Handle scalar values
-    if isinstance(value, str) and value:
-        # Detect PII in the string
-        entities = detect_pii_data(value)
-        if entities:
-            anonymized_value = value
-            for entity in entities:
-                fake_data = if_exists(existing_rows, entity['Type'], entity['originalData'])
-                if not fake_data:
-                    fake_data = if_exists(records, entity['Type'], entity['originalData'])
-                    if not fake_data:
-                        if entity['Type'] == 'DATE':
-                            fake_data = anonymize_date_hipaa(entity['originalData'])
-                            fake_data_generator = 'HIPAA_Date_Handler'
-                        else:
-                            fake_data_generator, fake_data = generate_fake_data(entity['Type'])
-                        
-                        new_record = {
-                            'uuid': masterid,
-                            'piiType': entity['Type'],
-                            'originalData': entity['originalData'],
-                            'fakeDataType': fake_data_generator,
-                            'fakeData': fake_data
-                        }
-                        if not _record_exists(new_record, records):
-                            new_records.append(new_record)
-                
-                anonymized_value = anonymized_value.replace(entity['originalData'], fake_data)
+                target.append(new_value)
             
-            return anonymized_value, new_records
-    
-    # Return non-string values as-is (including medical scores/values)
-    return value, new_records
+            if child:
+                # Descend now; this frame resumes from its iterator afterwards
+                stack.append(child)
+                break
+        else:
+            stack.pop()
+
+    return anonymized, records
 
 
-def _anonymize_scalar_value(value, masterid, existing_rows, records):
+def _anonymize_scalar(value, masterid, existing_index, records, records_index, hipaa_dates=False):
     """
     Anonymize a scalar value if it contains HIPAA identifiers.
+    With hipaa_dates, new DATE entities keep only the year instead of getting a fake date.
     """
-    if value is None or value == '' or isinstance(value, (int, float, bool)):
-        return value, []
-        
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+
+    text = value if isinstance(value, str) else str(value)
+    if not _may_contain_pii(text):
+        return value
+
     # Check if the string contains PII
-    entities = detect_pii_data(str(value))
-    
+    entities = detect_pii_data(text)
     if not entities:
-        return value, []
-        
+        return value
+
     # Anonymize detected entities
-    anonymized_value = str(value)
-    new_records = []
-    
+    replacements = {}
     for entity in entities:
-        fake_data = if_exists(existing_rows, entity['Type'], entity['originalData'])
+        fake_data = if_exists_indexed(existing_index, entity['Type'], entity['originalData'])
         if fake_data is None:
-            fake_data = if_exists(records, entity['Type'], entity['originalData'])
+            fake_data = if_exists_indexed(records_index, entity['Type'], entity['originalData'])
             if fake_data is None:
-                generator_name, fake_data = generate_fake_data(entity['Type'])
-                    
-                new_records.append({
+                if hipaa_dates and entity['Type'] == 'DATE':
+                    fake_data = anonymize_date_hipaa(entity['originalData'])
+                    generator_name = 'HIPAA_Date_Handler'
+                else:
+                    generator_name, fake_data = generate_fake_data(entity['Type'])
+                
+                new_record = {
                     'uuid': masterid,
                     'piiType': entity['Type'],
                     'originalData': entity['originalData'],
                     'fakeDataType': generator_name,
                     'fakeData': fake_data
-                })
+                }
+                records.append(new_record)
+                _index_record(records_index, new_record)
         
-        anonymized_value = anonymized_value.replace(entity['originalData'], fake_data)
-    
-    return anonymized_value, new_records
+        replacements.setdefault(entity['originalData'], fake_data)
 
+    return _replace_all(text, replacements)
 
-def determine_pii_type_from_content(key, value):
+
+def _may_contain_pii(value):
     """
-    Determine PII type from both key and value content.
-    Only returns types for HIPAA identifiers.
+    Cheap pre-check before running the PII detectors on a string.
+    Single characters, strings without letters or digits and all-digit strings
+    shorter than a ZIP code cannot hold any identifier the detectors report.
     """
-    key_lower = key.lower()
-    value_lower = value.lower() if isinstance(value, str) else ''
-    
-    # HIPAA identifiers only
-    if 'name' in key_lower and 'provider' not in key_lower and 'doctor' not in key_lower:
-        return 'NAME'
-    elif any(x in key_lower for x in ['phone', 'tel', 'mobile', 'cell', 'fax']):
-        return 'PHONE_NUMBER'
-    elif 'email' in key_lower:
-        return 'EMAIL'
-    elif 'address' in key_lower:
-        return 'ADDRESS'
-    elif any(x in key_lower for x in ['ssn', 'social']):
-        return 'SSN'
-    elif any(x in key_lower for x in ['mrn', 'medical_record', 'patient_id']):
-        return 'MRN'
-    elif 'date' in key_lower or 'dob' in key_lower:
-        return 'DATE'
-    elif 'zip' in key_lower:
-        return 'ZIP'
-    elif any(x in key_lower for x in ['insurance', 'member', 'policy']):
-        return 'INSURANCE_ID'
-    elif any(x in key_lower for x in ['license', 'certificate']):
-        return 'LICENSE_NUMBER'
-    elif any(x in key_lower for x in ['device', 'serial']):
-        return 'DEVICE_ID'
-    elif 'url' in key_lower or 'website' in key_lower:
-        return 'URL'
-    elif 'ip' in key_lower and 'address' in key_lower:
-        return 'IP_ADDRESS'
-    elif any(x in key_lower for x in ['employee_id', 'eid', 'staff_id']):
-        return 'EMPLOYEE_ID'
-    elif 'trial' in key_lower and any(x in value_lower for x in ['nct', 'clinical']):
-        return 'CLINICAL_TRIAL_ID'
-    else:
-        return determine_pii_type_from_key(key)
-
-
-def _record_exists(record, records):
-    """Check if a record already exists in the list."""
-    return any(
-        r['uuid'] == record['uuid'] and 
-        r['piiType'] == record['piiType'] and 
-        r['originalData'] == record['originalData'] 
-        for r in records
-    )
-
-
-def de_anonymize_json_simple(identity, identityType, json_data, context=None):
+    if len(value) < 2:
+        return False
+    if value.isdigit():
+        return len(value) >= 5
+    return _ALNUM_RE.search(value) is not None
+
+
+def _profile_detection_texts(profile):
+    """Gather the profile values that anonymize_profile runs detection on"""
+    texts = []
+    for key, value in profile.items():
+        if value == '' or value is None:
+            continue
+        key_lower = key.lower()
+        # DOB, ZIP and name fields are handled without detection
+        if ('dob' in key_lower or 'date of birth' in key_lower or 'zip' in key_lower
+                or 'first name' in key_lower or 'last name' in key_lower or key_lower == 'name'):
+            continue
+        texts.append(str(value))
+    return texts
+
+
+def _collect_detection_texts(data):
+    """Gather every string in a JSON tree that the anonymize walk may run detection on"""
+    texts = []
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, str) and _may_contain_pii(node):
+            texts.append(node)
+    return texts
+
+
+def _replace_all(text, replacements):
+    """
+    Replace every original -> fake pair in text.
+    A single pair is cheapest with str.replace. Two or more go through one
+    regex alternation (longest original first), which rewrites the text in
+    one pass, so a fake is never re-replaced by a later pair.
+    """
+    if len(replacements) == 1:
+        (original, fake_data), = replacements.items()
+        return text.replace(original, fake_data)
+
+    pattern = re.compile('|'.join(
+        re.escape(original) for original in sorted(replacements, key=len, reverse=True)
+    ))
+    return pattern.sub(lambda match: replacements[match.group(0)], text)
+
+
+def de_anonymize_json_simple(identity, identityType, json_data, context=None, masterid=None, rows=None,
+                             finite=False):
     """
     Simple de-anonymization that preserves structure and order.
+    Callers that already looked up the masterid and its PII rows can pass
+    them in to skip the duplicate database round-trips. finite is as for
+    anonymize_json_simple.
     """
+    # One timestamp per request, shared by the PIIData metadata and audit events
+    now_iso = datetime.datetime.utcnow().isoformat()
     try:
         if DEBUG_MODE:
             print(f"[DEBUG] Starting simple de-anonymization for identity: {identity}")
             
-        # Parse JSON preserving order
+        # Parse JSON - plain dicts preserve key order. A payload that arrived
+        # as a string is reused as received rather than re-serialized.
         if isinstance(json_data, str):
-            data = json.loads(json_data, object_pairs_hook=OrderedDict)
+            data, finite = _json_parse(json_data)
+            original_json = json_data
         else:
             data = json_data
+            original_json = _json_dumps(data, finite)
             
-        masterid = get_piimaster_uuid(identity, identityType, insert=False)
+        if masterid is None:
+            masterid = get_piimaster_uuid(identity, identityType, insert=False)
         
         if not masterid:
             return {
                 "statusCode": 200,
-                "body": json.dumps({
-                    "result": data,
-                    "entities_restored": 0
-                }, sort_keys=False)
+                "body": _restored_body(original_json, 0)
             }
         
         # Log de-anonymization access
-        log_phi_access(masterid, 'DE_ANONYMIZE_JSON_SIMPLE', 'json_data', context)
+        log_phi_access(masterid, 'DE_ANONYMIZE_JSON_SIMPLE', 'json_data', context, timestamp=now_iso)
         
         # Get all PII mappings for user
-        rows = get_piientity_data(masterid)
+        if rows is None:
+            rows = get_piientity_data(masterid)
         
         if not rows:
             return {
                 "statusCode": 200,
-                "body": json.dumps({
-                    "result": data,
-                    "entities_restored": 0
-                }, sort_keys=False)
+                "body": _restored_body(original_json, 0)
             }
         
         if DEBUG_MODE:
@@ -780,7 +823,10 @@ def de_anonymize_json_simple(identity, identityType, json_data, context=None):
         replacement_count = [0]  # Use list to pass by reference
         
         # Recursively de-anonymize while preserving structure
-        de_anonymized_data = _de_anonymize_json_recursive_ordered(data, rows, replacement_count)
+        fake_to_original = build_fake_to_original(rows)
+        de_anonymized_data = _de_anonymize_json_recursive_ordered(
+            data, fake_to_original, replacement_count, _compile_fake_pattern(rows)
+        )
         
         if DEBUG_MODE:
             print(f"[DEBUG] Made {replacement_count[0]} replacements")
@@ -789,37 +835,39 @@ def de_anonymize_json_simple(identity, identityType, json_data, context=None):
         metadata = {
             'gdpr_access_reason': context.get('access_reason') if context else None,
             'gdpr_authorized_by': context.get('authorized_by') if context else None,
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         }
-        insert_piidata(masterid, json.dumps(de_anonymized_data, sort_keys=False), 
-                      json.dumps(data, sort_keys=False), 
-                      'DE_ANONYMIZE_JSON_SIMPLE', metadata=json.dumps(metadata))
+        # Serialize once - the same string is stored and embedded in the response.
+        # Nothing restored means the tree is unchanged, so reuse the original.
+        if replacement_count[0]:
+            de_anonymized_json = _json_dumps(de_anonymized_data, finite)
+        else:
+            de_anonymized_json = original_json
+        insert_piidata(masterid, de_anonymized_json, 
+                      original_json, 
+                      'DE_ANONYMIZE_JSON_SIMPLE', metadata=_json_dumps(metadata))
         
         # Log success
         audit_logger.log_success({
             'masterid': masterid,
             'action': 'DE_ANONYMIZE_JSON_SIMPLE',
             'entities_restored': replacement_count[0],
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
         
         return {
             "statusCode": 200,
-            "body": json.dumps({
-                "result": de_anonymized_data,
-                "entities_restored": replacement_count[0]
-            }, sort_keys=False)
+            "body": _restored_body(de_anonymized_json, replacement_count[0])
         }
         
     except Exception as e:
-        import traceback
         if DEBUG_MODE:
             print(f"[DEBUG] Error: {traceback.format_exc()}")
         logger.error(e)
         audit_logger.log_error({
             'action': 'DE_ANONYMIZE_JSON_SIMPLE',
             'error': str(e),
-            'timestamp': datetime.datetime.utcnow().isoformat()
+            'timestamp': now_iso
         })
         return {
             "statusCode": 500,
@@ -827,164 +875,176 @@ def de_anonymize_json_simple(identity, identityType, json_data, context=None):
         }
 
 
-def _de_anonymize_json_recursive_ordered(data, rows, replacement_count):
+def _restored_body(result_json, restored):
+    """Wrap an already-serialized result in the de-anonymization response body"""
+    return '{"result": ' + result_json + ', "entities_restored": ' + str(restored) + '}'
+
+
+def build_fake_to_original(rows):
     """
-    Recursively de-anonymize JSON data while preserving structure and order.
+    Map each fake value to its original for exact-match de-anonymization.
+    The first row for a fake value wins, as with a linear scan over rows.
     """
-    if isinstance(data, (dict, OrderedDict)):
-        de_anonymized = OrderedDict()
-        for key, value in data.items():
-            de_anonymized[key] = _de_anonymize_json_recursive_ordered(value, rows, replacement_count)
-        return de_anonymized
-        
-    elif isinstance(data, list):
-        return [_de_anonymize_json_recursive_ordered(item, rows, replacement_count) for item in data]
-        
-    else:
-        # It's a scalar value - try to de-anonymize
-        if data is None or data == '':
-            return data
-            
-        # Try to find and replace fake data with original
-        result = str(data) if not isinstance(data, str) else data
-        
-        # Check each row for a match
-        for row in rows:
-            if row['fakeData'] == result:
-                if DEBUG_MODE:
-                    print(f"[DEBUG] Replacing '{row['fakeData']}' with '{row['originalData']}'")
-                replacement_count[0] += 1
-                return row['originalData']
-        
-        # Return the original value if no match found
+    fake_to_original = {}
+    for row in rows:
+        fake_to_original.setdefault(row['fakeData'], row['originalData'])
+    return fake_to_original
+
+
+def _de_anonymize_json_recursive_ordered(data, fake_to_original, replacement_count, pattern=None):
+    """
+    De-anonymize JSON data while preserving structure and order.
+    Walks the tree with an explicit stack, so deeply nested payloads
+    neither pay per-level call overhead nor hit the recursion limit.
+    fake_to_original is the lookup built by build_fake_to_original; with a
+    pattern from _compile_fake_pattern, fakes embedded in longer strings
+    (e.g. free-text notes) are restored too.
+    """
+    if not isinstance(data, (dict, list)):
+        return _de_anonymize_scalar(data, fake_to_original, replacement_count, pattern)
+
+    def substitute(match):
+        return fake_to_original[match.group(0)]
+
+    restored = 0
+    debug = DEBUG_MODE  # read once rather than as a global per replacement
+    de_anonymized = {} if isinstance(data, dict) else []
+    stack = [(data, de_anonymized)]
+    while stack:
+        source, target = stack.pop()
+        items = source.items() if isinstance(source, dict) else enumerate(source)
+        for key, value in items:
+            if isinstance(value, dict):
+                new_value = {}
+                stack.append((value, new_value))
+            elif isinstance(value, list):
+                new_value = []
+                stack.append((value, new_value))
+            elif isinstance(value, str) and value:
+                # Fake data is always a string - other scalars never match
+                new_value = fake_to_original.get(value)
+                if new_value is not None:
+                    if debug:
+                        print(f"[DEBUG] Replacing '{value}' with '{new_value}'")
+                    restored += 1
+                elif pattern is not None:
+                    new_value, count = pattern.subn(substitute, value)
+                    restored += count
+                else:
+                    new_value = value
+            else:
+                new_value = value
+
+            # Containers are attached before being filled, so order is preserved
+            if isinstance(target, dict):
+                target[key] = new_value
+            else:
+                target.append(new_value)
+
+    replacement_count[0] += restored
+    return de_anonymized
+
+
+def _de_anonymize_scalar(data, fake_to_original, replacement_count, pattern=None):
+    """
+    De-anonymize a single scalar value by exact match against the fake data,
+    falling back to replacing embedded fakes when a pattern is given.
+    """
+    # Fake data is always a string, so numbers and booleans can never match
+    if not isinstance(data, str) or data == '':
         return data
 
+    original = fake_to_original.get(data)
+    if original is None:
+        if pattern is None:
+            return data
+        restored_text, count = pattern.subn(lambda match: fake_to_original[match.group(0)], data)
+        replacement_count[0] += count
+        return restored_text
+
+    if DEBUG_MODE:
+        print(f"[DEBUG] Replacing '{data}' with '{original}'")
+    replacement_count[0] += 1
+    return original
+
 
-def anonymize_json(identity, identityType, json_data, context=None):
+def anonymize_json(identity, identityType, json_data, context=None, finite=False):
     """
     Main entry point for JSON anonymization.
     Now uses simple anonymization that preserves structure.
     """
-    return anonymize_json_simple(identity, identityType, json_data, context)
+    return anonymize_json_simple(identity, identityType, json_data, context, finite=finite)
 
 
-def de_anonymize_json(identity, identityType, json_data, context=None):
+def de_anonymize_json(identity, identityType, json_data, context=None, finite=False):
     """
     Main entry point for JSON de-anonymization.
     """
     # Check if this was enhanced anonymization (for backward compatibility)
     masterid = get_piimaster_uuid(identity, identityType, insert=False)
-    if masterid:
-        rows = get_piientity_data(masterid)
-        has_structure_map = any(row['piiType'] == 'JSON_STRUCTURE' for row in rows if row)
-        
-        if has_structure_map:
-            # Old enhanced anonymization - not recommended
-            print("[WARNING] This data was anonymized with the old enhanced method that changes structure.")
-            return {
-                "statusCode": 400,
-                "error": "Data was anonymized with structure transformation. Please re-anonymize with current version."
-            }
-    
-    # Use simple de-anonymization
-    return de_anonymize_json_simple(identity, identityType, json_data, context)
+    if not masterid:
+        return de_anonymize_json_simple(identity, identityType, json_data, context, finite=finite)
 
+    rows = get_piientity_data(masterid)
+    has_structure_map = any(row['piiType'] == 'JSON_STRUCTURE' for row in rows if row)
 
-def _de_anonymize_json_recursive(data, rows):
-    """
-    Recursively de-anonymize JSON data (kept for backward compatibility).
-    """
-    if isinstance(data, dict):
-        de_anonymized = {}
-        for key, value in data.items():
-            de_anonymized[key] = _de_anonymize_json_recursive(value, rows)
-        return de_anonymized
-        
-    elif isinstance(data, list):
-        return [_de_anonymize_json_recursive(item, rows) for item in data]
-        
-    else:
-        # It's a scalar value - try to de-anonymize
-        if data is None or data == '':
-            return data
-            
-        # Try to find and replace fake data with original
-        result = str(data)
-        for row in rows:
-            if row['fakeData'] in result:
-                result = result.replace(row['fakeData'], row['originalData'])
-                
-        # Return appropriate type
-        if isinstance(data, str):
-            return result
-        else:
-            return data
+    if has_structure_map:
+        # Old enhanced anonymization - not recommended
+        print("[WARNING] This data was anonymized with the old enhanced method that changes structure.")
+        return {
+            "statusCode": 400,
+            "error": "Data was anonymized with structure transformation. Please re-anonymize with current version."
+        }
+
+    # Use simple de-anonymization with the lookups already done above
+    return de_anonymize_json_simple(identity, identityType, json_data, context,
+                                    masterid=masterid, rows=rows, finite=finite)
 
 
-def determine_pii_type_from_key(key):
+def _compile_fake_pattern(rows):
     """
-    Determine the PII type based on the key name.
-    Only returns types for HIPAA identifiers.
+    Build one regex alternation over the fakes that can be restored from
+    inside longer strings (longest first), so every one in a string is found
+    in a single scan. Fakes only match as whole words. Masks and fakes shared
+    by several originals are left out, since they cannot be reversed, and so
+    are single plain words (e.g. a fake surname like "Park"), which are as
+    likely to be ordinary words in free text. Those are still restored when
+    they make up a whole value. Returns None if there are none.
     """
-    key_lower = key.lower()
-    
-    # HIPAA identifiers only
-    if 'name' in key_lower and 'provider' not in key_lower and 'doctor' not in key_lower and 'physician' not in key_lower:
-        return 'NAME'
-    elif any(x in key_lower for x in ['phone', 'tel', 'mobile', 'cell', 'fax']):
-        return 'PHONE_NUMBER'
-    elif 'email' in key_lower:
-        return 'EMAIL'
-    elif 'address' in key_lower:
-        return 'ADDRESS'
-    elif any(x in key_lower for x in ['ssn', 'social']):
-        return 'SSN'
-    elif any(x in key_lower for x in ['mrn', 'medical_record', 'patient_id']):
-        return 'MRN'
-    elif 'date' in key_lower or 'dob' in key_lower or 'birth' in key_lower:
-        return 'DATE'
-    elif 'zip' in key_lower:
-        return 'ZIP'
-    elif any(x in key_lower for x in ['insurance', 'member', 'policy', 'beneficiary']):
-        return 'INSURANCE_ID'
-    elif any(x in key_lower for x in ['license', 'certificate']):
-        return 'LICENSE_NUMBER'
-    elif any(x in key_lower for x in ['device', 'serial', 'implant']):
-        return 'DEVICE_ID'
-    elif 'url' in key_lower or 'website' in key_lower:
-        return 'URL'
-    elif 'ip' in key_lower and 'address' in key_lower:
-        return 'IP_ADDRESS'
-    elif any(x in key_lower for x in ['employee_id', 'eid', 'staff_id']):
-        return 'EMPLOYEE_ID'
-    elif any(x in key_lower for x in ['vehicle', 'vin', 'plate']):
-        return 'VEHICLE_ID'
-    elif any(x in key_lower for x in ['fingerprint', 'retinal', 'voiceprint', 'biometric']):
-        return 'BIOMETRIC_ID'
-    elif 'trial' in key_lower:
-        return 'CLINICAL_TRIAL_ID'
-    else:
-        return 'OTHER'
+    originals = {}
+    masked = set()
+    for row in rows:
+        fake = row['fakeData']
+        if not fake:
+            continue
+        originals.setdefault(fake, set()).add(row['originalData'])
+        if row.get('fakeDataType') in _MASK_FAKE_TYPES:
+            masked.add(fake)
+
+    fakes = sorted((fake for fake, found in originals.items()
+                    if len(found) == 1 and fake not in masked and not fake.isalpha()),
+                   key=len, reverse=True)
+    if not fakes:
+        return None
+    return re.compile(r'(?<!\w)(?:' + '|'.join(map(re.escape, fakes)) + r')(?!\w)')
 
 
 def anonymize_date_hipaa(date_str):
     """
     Anonymize date according to HIPAA Safe Harbor.
-    Keeps only the year if the date is not in the current year.
+    Keeps only the year; month and day are always masked.
     """
+    # Fast path for the common formats - the year is read straight from the match
+    match = _DATE_RE.match(date_str)
+    if match:
+        return f"XX/XX/{match.group(1) or match.group(6) or match.group(9)}"
+
     try:
-        from datetime import datetime
-        current_year = datetime.now().year
-        
-        # Try different date formats
+        # Fall back to strptime for less common layouts (e.g. single-digit day/month)
         for fmt in ['%d/%b/%Y', '%d/%m/%Y', '%Y-%m-%d', '%m/%d/%Y']:
             try:
-                date_obj = datetime.strptime(date_str, fmt)
-                if date_obj.year < current_year:
-                    return f"XX/XX/{date_obj.year}"
-                else:
-                    # Current year - anonymize month/day
-                    return f"XX/XX/{date_obj.year}"
+                date_obj = datetime.datetime.strptime(date_str, fmt)
+                return f"XX/XX/{date_obj.year}"
             except:
                 continue
                 
@@ -994,102 +1054,67 @@ def anonymize_date_hipaa(date_str):
         return "XX/XX/XXXX"
 
 
-def should_anonymize_key(key):
-    """
-    Determine if a key likely contains HIPAA identifiers based on its name.
-    Only returns True for keys that might contain the 18 HIPAA identifiers.
-    """
-    hipaa_keywords = [
-        # Names (but not provider names)
-        'patient_name', 'name', 'first_name', 'last_name', 'middle_name',
-        'relative', 'mother', 'father', 'spouse', 'employer',
-        # Geographic
-        'address', 'street', 'city', 'state', 'zip', 'zipcode', 'location',
-        # Dates
-        'date', 'dob', 'birth', 'admission', 'discharge', 'death',
-        # Contact info
-        'phone', 'telephone', 'mobile', 'cell', 'fax', 'email',
-        # IDs
-        'ssn', 'social', 'mrn', 'medical_record', 'patient_id',
-        'insurance', 'member', 'policy', 'beneficiary',
-        'license', 'certificate', 'employee_id', 'staff_id',
-        # Technical
-        'device', 'serial', 'implant', 'url', 'website', 'ip_address',
-        'vehicle', 'vin', 'plate',
-        # Biometric
-        'fingerprint', 'retinal', 'voiceprint', 'biometric',
-        # Other
-        'trial', 'photo', 'image', 'unique_id'
-    ]
-    
-    key_lower = key.lower()
-    
-    # Special handling for "name" fields - always check unless it's explicitly a provider
-    if 'name' in key_lower and not any(provider in key_lower for provider in ['provider', 'doctor', 'physician', 'clinician', 'therapist']):
-        return True
-    
-    # Exclude provider/doctor names from anonymization
-    if any(provider in key_lower for provider in ['provider', 'doctor', 'physician', 'clinician', 'therapist']):
-        return False
-    
-    return any(keyword in key_lower for keyword in hipaa_keywords)
-
-
 def lambda_handler(event, context):
     """Enhanced lambda handler with JSON support"""
-    method = None
-    identity = None
-    identityType = None
-    conversation = None
-    profile = None
-    json_data = None
-    request_context = {}
-    
     logger.debug(event)
-    print(event)
-    body = json.loads(event['body'])
-
-    for k, v in body.items():
-        if k.upper() == 'METHOD':
-            method = v.upper()
-        elif k.upper() == 'IDENTITY':
-            identity = v.upper()
-        elif k.upper() == 'IDENTITYTYPE':
-            identityType = v.upper()
-        elif k.upper() == 'CONVERSATION':
-            conversation = v
-        elif k.upper() == 'PROFILE':
-            profile = ast.literal_eval(v)
-        elif k.upper() == 'JSON_DATA':
-            json_data = v
-        elif k.upper() == 'CONTEXT':
-            request_context = v if isinstance(v, dict) else json.loads(v)
+    # A JSON_DATA object decoded here by orjson cannot hold NaN or Infinity
+    body, finite = _json_parse(event['body'])
+
+    # Normalize field names once, then look each field up directly
+    body_u = {k.upper(): v for k, v in body.items()}
+
+    method = body_u.get('METHOD')
+    method = method.upper() if method is not None else None
+    identity = body_u.get('IDENTITY')
+    identity = identity.upper() if identity is not None else None
+    identityType = body_u.get('IDENTITYTYPE')
+    identityType = identityType.upper() if identityType is not None else None
+    conversation = body_u.get('CONVERSATION')
+    json_data = body_u.get('JSON_DATA')
+
+    profile = body_u.get('PROFILE')
+    if isinstance(profile, str):
+        try:
+            profile = _json_loads(profile)
+        except ValueError:
+            # Profiles may still arrive as Python literals (single-quoted)
+            profile = ast.literal_eval(profile)
+
+    request_context = body_u.get('CONTEXT', {})
+    if not isinstance(request_context, dict):
+        request_context = _json_loads(request_context)
 
     # Add Lambda context info for audit
     request_context['lambda_request_id'] = context.request_id if context else None
     request_context['lambda_function_name'] = context.function_name if context else None
 
-    print(method)
-    if method == 'ANONYMIZE':
-        if json_data:
-            response = anonymize_json(identity, identityType, json_data, request_context)
-        elif conversation:
-            response = anonymizer(identity, identityType, conversation, request_context)
-        else:
-            response = anonymize_profile(identity, identityType, profile, request_context)
-    elif method == 'DE-ANONYMIZE':
-        if json_data:
-            response = de_anonymize_json(identity, identityType, json_data, request_context)
-        elif conversation:
-            response = de_anonymizer(identity, identityType, conversation, request_context)
+    if DEBUG_MODE:
+        print(f"[DEBUG] Method: {method}")
+    try:
+        if method == 'ANONYMIZE':
+            if json_data:
+                response = anonymize_json(identity, identityType, json_data, request_context, finite=finite)
+            elif conversation:
+                response = anonymizer(identity, identityType, conversation, request_context)
+            else:
+                response = anonymize_profile(identity, identityType, profile, request_context)
+        elif method == 'DE-ANONYMIZE':
+            if json_data:
+                response = de_anonymize_json(identity, identityType, json_data, request_context, finite=finite)
+            elif conversation:
+                response = de_anonymizer(identity, identityType, conversation, request_context)
+            else:
+                response = de_anonymize_profile(identity, identityType, profile, request_context)
+        elif method == 'ANONYMIZE_JSON':
+            response = anonymize_json(identity, identityType, json_data, request_context, finite=finite)
+        elif method == 'DE_ANONYMIZE_JSON':
+            response = de_anonymize_json(identity, identityType, json_data, request_context, finite=finite)
         else:
-            response = de_anonymize_profile(identity, identityType, profile, request_context)
-    elif method == 'ANONYMIZE_JSON':
-        response = anonymize_json(identity, identityType, json_data, request_context)
-    elif method == 'DE_ANONYMIZE_JSON':
-        response = de_anonymize_json(identity, identityType, json_data, request_context)
-    else:
-        logger.debug(f"No handler for http verb: {event['Method']}")
-        raise Exception(f"No handler for http verb: {event['Method']}")
+            logger.debug(f"No handler for http verb: {event['Method']}")
+            raise Exception(f"No handler for http verb: {event['Method']}")
+    finally:
+        # Audit entries are written in the background; make sure they are out
+        # before Lambda freezes the container
+        audit_logger.flush()
 
     return response
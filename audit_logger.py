@@ -4,7 +4,10 @@ This is a basic implementation - enhance for production use
 """
 
 import json
+import queue
+import atexit
 import logging
+import threading
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -43,3 +46,61 @@ class AuditLogger:
             
         except Exception as e:
             logger.error(f"Failed to write audit log: {e}")
+
+
+class AsyncAuditLogger(AuditLogger):
+    """
+    Audit logger that queues entries and writes them from a background thread.
+    Entries are timestamped when logged, so queueing does not skew the trail.
+    Call flush() before the process may be frozen or exit (e.g. at the end of
+    a Lambda invocation); it is also registered with atexit.
+    """
+    
+    def __init__(self, log_file='audit.log', max_queue_size=10000, batch_size=128, batch_wait=0.05):
+        super().__init__(log_file)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._writer = threading.Thread(target=self._drain, name='audit-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+        
+    def flush(self):
+        """Block until every queued entry has been written"""
+        self._queue.join()
+        
+    def _write_log(self, event_type, event_data):
+        """Queue log entry for the writer thread"""
+        # Capture the time now but leave building the entry to the writer
+        pending = (event_type, datetime.utcnow(), event_data)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            # Never drop audit events - write inline instead
+            self._emit(*pending)
+            
+    def _drain(self):
+        """Writer loop: take up to batch_size entries, waiting batch_wait for more"""
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.batch_wait))
+            except queue.Empty:
+                pass
+            
+            for pending in batch:
+                self._emit(*pending)
+                self._queue.task_done()
+                
+    def _emit(self, event_type, logged_at, event_data):
+        """Build and write a single log entry"""
+        try:
+            log_entry = {
+                'event_type': event_type,
+                'timestamp': logged_at.isoformat(),
+                'data': event_data
+            }
+            logger.info(f"AUDIT: {json.dumps(log_entry)}")
+        except Exception as e:
+            logger.error(f"Failed to write audit log: {e}")
@@ -9,7 +9,6 @@ import json
 import uuid
 import os
 from datetime import datetime
-from collections import OrderedDict
 
 # Import your anonymizer modules
 from anonymizer import (anonymizer, de_anonymizer, anonymize_profile, 
@@ -842,8 +841,8 @@ def anonymize_json_endpoint():
         if result['statusCode'] != 200:
             return jsonify({'error': result.get('error', 'Unknown error')}), 500
         
-        # Parse the body preserving order
-        body = json.loads(result['body'], object_pairs_hook=OrderedDict)
+        # Parse the body (dicts preserve key order)
+        body = json.loads(result['body'])
         
         # Return response preserving order
         response = {
@@ -891,8 +890,8 @@ def deanonymize_json_endpoint():
         if result['statusCode'] != 200:
             return jsonify({'error': result.get('error', 'Unknown error')}), 500
         
-        # Parse the body preserving order
-        body = json.loads(result['body'], object_pairs_hook=OrderedDict)
+        # Parse the body (dicts preserve key order)
+        body = json.loads(result['body'])
         
         # Return response preserving order
         response = {
@@ -6,24 +6,147 @@ Medical information is preserved for healthcare use
 
 import re
 import random
+import logging
 import string
 import json
-import hashlib
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple, Any
 from faker import Faker
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 # Initialize Faker for generating fake data
 fake = Faker()
 
+# Concurrent Comprehend requests issued by prefetch_pii_data
+PII_PREFETCH_WORKERS = 16
+
 # Initialize AWS Comprehend client (if using AWS)
+# The connection pool is sized so every prefetch worker keeps its own connection;
+# throttling and transient errors are retried by botocore's standard retry mode
 try:
-    comprehend_client = boto3.client('comprehend', region_name='us-east-1')
+    comprehend_client = boto3.client(
+        'comprehend',
+        region_name='us-east-1',
+        config=Config(max_pool_connections=PII_PREFETCH_WORKERS, retries={'mode': 'standard'})
+    )
 except:
     comprehend_client = None
     print("AWS Comprehend not available, using local detection only")
 
+# Cheap pre-check for detect_local_pii. Every local pattern needs a digit, an
+# uppercase letter, an '@' or one of these (case-insensitive) keywords, so text
+# without any of them cannot produce a local entity.
+_LOCAL_PII_GATE = re.compile(
+    r'[\dA-Z@]|(?i:mother|father|sister|brother|spouse|wife|husband|son|daughter|parent'
+    r'|hello|hi|dear|hey|called|named|contacted|insurance|member|policy|license|certificate'
+    r'|plate|vin|serial|sn|device|pacemaker|pump|implant|fingerprint|retinal|voiceprint'
+    r'|facial|employee|eid|http|mrn|patient)'
+)
+
+
+# Common medical/non-name terms; a candidate name containing any of them is
+# not treated as a name. Matched with one case-insensitive alternation.
+_MEDICAL_TERMS = (
+    'Type', 'Diabetes', 'Hypertension', 'Blood', 'Pressure', 'Heart', 'Rate',
+    'Glucose', 'Insulin', 'Metformin', 'Lisinopril', 'Daily', 'Twice',
+    'Morning', 'Evening', 'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December',
+    'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday',
+    'North', 'South', 'East', 'West', 'Central', 'General', 'Hospital',
+    'Clinic', 'Center', 'Medical', 'Health', 'Care', 'Service', 'Department',
+    'Emergency', 'Primary', 'Secondary', 'Tertiary', 'Internal', 'Family',
+    'Physical', 'Mental', 'Behavioral', 'Cognitive', 'Memory', 'Sleep',
+    'Pain', 'Chronic', 'Acute', 'Severe', 'Moderate', 'Mild', 'Normal',
+    'Abnormal', 'Positive', 'Negative', 'Stable', 'Critical', 'Fair', 'Good',
+    'Poor', 'Excellent', 'Test', 'Result', 'Lab', 'Report', 'Study',
+    'Clinical', 'Trial', 'Research', 'Protocol', 'Standard', 'Guideline'
+)
+_MEDICAL_TERM_RE = re.compile('|'.join(map(re.escape, _MEDICAL_TERMS)), re.IGNORECASE)
+
+
+# Patterns for detect_local_pii, compiled once at import
+# Healthcare provider names, excluded from name detection
+_PROVIDER_TITLES = r'\b(?:Dr\.?|Doctor|MD|RN|NP|PA|Nurse|Physician|Therapist|Psychiatrist|Psychologist|Counselor)\b'
+_PROVIDER_NAME_RE = re.compile(rf'{_PROVIDER_TITLES}\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*')
+# Name patterns - Enhanced to catch more name formats; (pattern, case_insensitive)
+_NAME_RES = tuple(re.compile(pattern, re.IGNORECASE if case_insensitive else 0) for pattern, case_insensitive in (
+    # Name: pattern at start of line
+    (r'Name:\s*([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)', False),
+    # Patient: pattern
+    (r'Patient:\s*([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)', False),
+    # Names with titles - capture the whole thing including title
+    (r'\b((?:Mr\.?|Mrs\.?|Ms\.?|Miss)\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\b', False),
+    # Relative patterns
+    (r'\b(?:mother|father|sister|brother|spouse|wife|husband|son|daughter|parent)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', True),
+    # General name pattern (First Last) - in specific contexts
+    (r'\b([A-Z][a-z]+\s+[A-Z][a-z]+)(?=\s*(?:DOB|Phone|Address|,|\n|$|works|lives|employed|called|contacted|visited))', False),
+    # Single capitalized names in conversation context
+    (r'(?:Hello|Hi|Dear|Hey)\s+([A-Z][a-z]+)', True),
+    # Standalone last names after titles without first names
+    (r'(?:Mr\.?|Mrs\.?|Ms\.?|Miss)\s+([A-Z][a-z]+)(?:\s|,|\.)', False),
+    # Names in quotes or after certain verbs
+    (r'(?:called|named|contacted)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', True),
+    # Standalone capitalized words that could be names in specific contexts
+    (r'(?:^|\.\s+)([A-Z][a-z]+)(?:\s*[:,]|\s+(?:how|are|is|was|has|had|will|would|can|could|should))', False),
+    # Simple First Last pattern for JSON/isolated contexts
+    (r'^([A-Z][a-z]+\s+[A-Z][a-z]+)$', False),
+    # Three-part names (First Middle Last)
+    (r'^([A-Z][a-z]+\s+[A-Z][a-z]+\s+[A-Z][a-z]+)$', False),
+))
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+_PHONE_RES = tuple(re.compile(pattern) for pattern in (
+    r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b',
+    r'\b\(\d{3}\)\s*\d{3}[-.]?\d{4}\b',
+    r'\b\+?1?\s*\(?(\d{3})\)?[-.\s]?(\d{3})[-.\s]?(\d{4})\b'
+))
+_SSN_RE = re.compile(r'\b\d{3}-\d{2}-\d{4}\b')
+_DATE_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',
+    r'\b\d{2,4}[/-]\d{1,2}[/-]\d{1,2}\b',
+    r'\b\d{1,2}\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4}\b',
+    r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{2,4}\b'
+))
+_CC_RE = re.compile(r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b')
+_ZIP_RE = re.compile(r'\b\d{5}(?:-\d{4})?\b')
+_ADDRESS_RE = re.compile(r'\b\d+\s+[A-Za-z\s]+(?:St|Street|Ave|Avenue|Rd|Road|Dr|Drive|Ln|Lane|Blvd|Boulevard|Way|Court|Ct|Plaza|Place|Pl)\.?\s*,?\s*[A-Za-z\s]+,?\s*[A-Z]{2}\s+\d{5}(?:-\d{4})?')
+_MRN_RES = tuple(re.compile(pattern) for pattern in (
+    r'\b(?:MRN|mrn|Medical Record Number)[\s:#-]*([A-Z0-9-]+)\b',
+    r'\b(?:Patient ID|patient id)[\s:#-]*([A-Z0-9-]+)\b',
+    r'\b[A-Z]{2,4}-\d{6,10}\b'  # Common MRN format
+))
+_INSURANCE_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'Insurance ID:\s*([A-Z0-9]+)',
+    r'\b(?:Member ID|Policy Number)[\s:#-]*([A-Z0-9-]+)\b',
+    r'\b[A-Z]{1,3}\d{6,12}\b'  # Common insurance ID format
+))
+_LICENSE_RE = re.compile(r'\b(?:License|Certificate)[\s#:]*([A-Z0-9-]+)\b', re.IGNORECASE)
+_VEHICLE_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'\b(?:License Plate|Plate)[\s:#]*([A-Z0-9-]+)\b',
+    r'\bVIN[\s:#]*([A-Z0-9]{17})\b'
+))
+_DEVICE_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'\b(?:Serial Number|Serial|SN)[\s:#]*([A-Z0-9-]+)\b',
+    r'\b(?:Device ID|Device)[\s:#]*([A-Z0-9-]+)\b',
+    r'\b(?:Pacemaker|Pump|Implant)\s+(?:ID|Serial)[\s:#]*([A-Z0-9-]+)\b'
+))
+_URL_RE = re.compile(r'https?://[^\s]+')
+_IP_RE = re.compile(r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b')
+_BIOMETRIC_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'\b(?:Fingerprint|Retinal|Voiceprint|Facial Recognition)[\s:]*(ID)?[\s:#]*([A-Z0-9-]+)\b',
+))
+_TRIAL_RE = re.compile(r'\bNCT\d{8}\b')
+_EMPLOYEE_RE = re.compile(r'\b(?:Employee ID|EID)[\s:#]*([A-Z0-9-]+)\b', re.IGNORECASE)
+
+
+# Number of distinct texts whose detection results are memoized
+PII_DETECT_CACHE_SIZE = 4096
+
 
 def detect_pii_data(text: str) -> List[Dict[str, Any]]:
     """
@@ -31,7 +154,56 @@ def detect_pii_data(text: str) -> List[Dict[str, Any]]:
     Only detects the 18 HIPAA Safe Harbor identifiers.
     Does NOT detect medical/diagnostic information.
     """
+    # Callers annotate entities in place, so hand out copies of the cached ones
+    return [dict(entity) for entity in _detect_pii(text)]
+
+
+class _UncachedDetection(Exception):
+    """Carries a detection result that must not be memoized"""
+    
+    def __init__(self, entities):
+        super().__init__()
+        self.entities = entities
+
+
+def _detect_pii(text: str) -> Tuple[Dict[str, Any], ...]:
+    """Cached detection, falling back to the uncached result when Comprehend failed"""
+    try:
+        return _detect_pii_cached(text)
+    except _UncachedDetection as fallback:
+        return fallback.entities
+
+
+def prefetch_pii_data(texts) -> None:
+    """
+    Run detection for many texts concurrently so that later detect_pii_data
+    calls are served from the cache. Comprehend calls are network-bound, so
+    they overlap well in threads; without Comprehend this is a no-op.
+    Only the first PII_DETECT_CACHE_SIZE distinct texts are prefetched, so
+    nothing is evicted before it is used.
+    """
+    if not comprehend_client:
+        return
+    
+    unique_texts = list(dict.fromkeys(texts))[:PII_DETECT_CACHE_SIZE]
+    if len(unique_texts) < 2:
+        return
+    
+    with ThreadPoolExecutor(max_workers=min(PII_PREFETCH_WORKERS, len(unique_texts))) as executor:
+        # Consume the iterator so every call completes before returning
+        for _ in executor.map(_detect_pii, unique_texts):
+            pass
+
+
+@lru_cache(maxsize=PII_DETECT_CACHE_SIZE)
+def _detect_pii_cached(text: str) -> Tuple[Dict[str, Any], ...]:
+    """
+    Memoized detection backing detect_pii_data.
+    Raises _UncachedDetection when Comprehend failed, so that the degraded
+    local-only result is not cached and the next call retries Comprehend.
+    """
     entities = []
+    comprehend_failed = False
     
     # Try AWS Comprehend first if available
     if comprehend_client:
@@ -52,8 +224,14 @@ def detect_pii_data(text: str) -> List[Dict[str, Any]]:
                         'EndOffset': entity['EndOffset'],
                         'Score': entity['Score']
                     })
+        except (ClientError, BotoCoreError) as e:
+            # Includes NoCredentialsError, which on EC2/ECS can be a transient
+            # metadata timeout - keep the client so the next call retries
+            logger.error(f"AWS Comprehend error: {e}, falling back to local detection")
+            comprehend_failed = True
         except Exception as e:
-            print(f"AWS Comprehend error: {e}, falling back to local detection")
+            logger.error(f"Unexpected Comprehend error: {e}, falling back to local detection")
+            comprehend_failed = True
     
     # Always run local detection for patterns AWS might miss
     local_entities = detect_local_pii(text)
@@ -62,8 +240,10 @@ def detect_pii_data(text: str) -> List[Dict[str, Any]]:
     all_entities = entities + local_entities
     
     # Remove duplicates and overlapping entities
-    cleaned_entities = remove_overlapping_entities(all_entities)
+    cleaned_entities = tuple(remove_overlapping_entities(all_entities))
     
+    if comprehend_failed:
+        raise _UncachedDetection(cleaned_entities)
     return cleaned_entities
 
 
@@ -73,60 +253,16 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
     Only detects HIPAA Safe Harbor identifiers.
     """
     entities = []
+    if not _LOCAL_PII_GATE.search(text):
+        return entities
     
     # HIPAA Identifier 1: Names (but NOT healthcare provider names)
     # First, let's identify healthcare provider names to exclude them
-    provider_titles = r'\b(?:Dr\.?|Doctor|MD|RN|NP|PA|Nurse|Physician|Therapist|Psychiatrist|Psychologist|Counselor)\b'
-    provider_pattern = rf'{provider_titles}\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*'
-    provider_matches = list(re.finditer(provider_pattern, text))
+    provider_matches = list(_PROVIDER_NAME_RE.finditer(text))
     provider_spans = [(m.start(), m.end()) for m in provider_matches]
     
-    # Name patterns - Enhanced to catch more name formats
-    name_patterns = [
-        # Name: pattern at start of line
-        (r'Name:\s*([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)', False),
-        # Patient: pattern
-        (r'Patient:\s*([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)', False),
-        # Names with titles - capture the whole thing including title
-        (r'\b((?:Mr\.?|Mrs\.?|Ms\.?|Miss)\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\b', False),
-        # Relative patterns
-        (r'\b(?:mother|father|sister|brother|spouse|wife|husband|son|daughter|parent)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', True),
-        # General name pattern (First Last) - in specific contexts
-        (r'\b([A-Z][a-z]+\s+[A-Z][a-z]+)(?=\s*(?:DOB|Phone|Address|,|\n|$|works|lives|employed|called|contacted|visited))', False),
-        # Single capitalized names in conversation context
-        (r'(?:Hello|Hi|Dear|Hey)\s+([A-Z][a-z]+)', True),
-        # Standalone last names after titles without first names
-        (r'(?:Mr\.?|Mrs\.?|Ms\.?|Miss)\s+([A-Z][a-z]+)(?:\s|,|\.)', False),
-        # Names in quotes or after certain verbs
-        (r'(?:called|named|contacted)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', True),
-        # Standalone capitalized words that could be names in specific contexts
-        (r'(?:^|\.\s+)([A-Z][a-z]+)(?:\s*[:,]|\s+(?:how|are|is|was|has|had|will|would|can|could|should))', False),
-        # Simple First Last pattern for JSON/isolated contexts
-        (r'^([A-Z][a-z]+\s+[A-Z][a-z]+)$', False),
-        # Three-part names (First Middle Last)
-        (r'^([A-Z][a-z]+\s+[A-Z][a-z]+\s+[A-Z][a-z]+)$', False),
-    ]
-    
-    # Common medical/non-name terms to exclude
-    medical_terms = [
-        'Type', 'Diabetes', 'Hypertension', 'Blood', 'Pressure', 'Heart', 'Rate',
-        'Glucose', 'Insulin', 'Metformin', 'Lisinopril', 'Daily', 'Twice',
-        'Morning', 'Evening', 'January', 'February', 'March', 'April', 'May', 'June',
-        'July', 'August', 'September', 'October', 'November', 'December',
-        'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday',
-        'North', 'South', 'East', 'West', 'Central', 'General', 'Hospital',
-        'Clinic', 'Center', 'Medical', 'Health', 'Care', 'Service', 'Department',
-        'Emergency', 'Primary', 'Secondary', 'Tertiary', 'Internal', 'Family',
-        'Physical', 'Mental', 'Behavioral', 'Cognitive', 'Memory', 'Sleep',
-        'Pain', 'Chronic', 'Acute', 'Severe', 'Moderate', 'Mild', 'Normal',
-        'Abnormal', 'Positive', 'Negative', 'Stable', 'Critical', 'Fair', 'Good',
-        'Poor', 'Excellent', 'Test', 'Result', 'Lab', 'Report', 'Study',
-        'Clinical', 'Trial', 'Research', 'Protocol', 'Standard', 'Guideline'
-    ]
-    
-    for pattern, case_insensitive in name_patterns:
-        flags = re.IGNORECASE if case_insensitive else 0
-        for match in re.finditer(pattern, text, flags):
+    for pattern in _NAME_RES:
+        for match in pattern.finditer(text):
             if match.lastindex:
                 name = match.group(match.lastindex)
                 name_start = match.start(match.lastindex)
@@ -140,7 +276,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
             is_provider = any(name_start >= ps and name_end <= pe for ps, pe in provider_spans)
             
             # Check if this is a medical term (not a name)
-            is_medical = any(term.lower() == name.lower() or term.lower() in name.lower() for term in medical_terms)
+            is_medical = _MEDICAL_TERM_RE.search(name) is not None
             
             # Check if we've already detected this name span
             already_detected = any(
@@ -160,8 +296,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
                 })
     
     # HIPAA Identifier 3: Email addresses
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    for match in re.finditer(email_pattern, text):
+    for match in _EMAIL_RE.finditer(text):
         entities.append({
             'Type': 'EMAIL',
             'originalData': match.group(),
@@ -171,13 +306,8 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # HIPAA Identifier 4: Phone numbers
-    phone_patterns = [
-        r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b',
-        r'\b\(\d{3}\)\s*\d{3}[-.]?\d{4}\b',
-        r'\b\+?1?\s*\(?(\d{3})\)?[-.\s]?(\d{3})[-.\s]?(\d{4})\b'
-    ]
-    for pattern in phone_patterns:
-        for match in re.finditer(pattern, text):
+    for pattern in _PHONE_RES:
+        for match in pattern.finditer(text):
             entities.append({
                 'Type': 'PHONE_NUMBER',
                 'originalData': match.group(),
@@ -190,8 +320,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
     # Already covered by phone patterns above
     
     # HIPAA Identifier 7: Social Security Numbers
-    ssn_pattern = r'\b\d{3}-\d{2}-\d{4}\b'
-    for match in re.finditer(ssn_pattern, text):
+    for match in _SSN_RE.finditer(text):
         entities.append({
             'Type': 'SSN',
             'originalData': match.group(),
@@ -201,14 +330,8 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # HIPAA Identifier 3: Dates (except year)
-    date_patterns = [
-        r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',
-        r'\b\d{2,4}[/-]\d{1,2}[/-]\d{1,2}\b',
-        r'\b\d{1,2}\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4}\b',
-        r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{2,4}\b'
-    ]
-    for pattern in date_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
+    for pattern in _DATE_RES:
+        for match in pattern.finditer(text):
             entities.append({
                 'Type': 'DATE',
                 'originalData': match.group(),
@@ -218,8 +341,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
             })
     
     # HIPAA Identifier 10: Account numbers (credit cards)
-    cc_pattern = r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b'
-    for match in re.finditer(cc_pattern, text):
+    for match in _CC_RE.finditer(text):
         entities.append({
             'Type': 'CREDIT_DEBIT_NUMBER',
             'originalData': match.group(),
@@ -229,8 +351,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # HIPAA Identifier 2: Geographic subdivisions - ZIP codes
-    zip_pattern = r'\b\d{5}(?:-\d{4})?\b'
-    for match in re.finditer(zip_pattern, text):
+    for match in _ZIP_RE.finditer(text):
         # Check if it's not part of a longer number
         if match.start() == 0 or not text[match.start()-1].isdigit():
             if match.end() == len(text) or not text[match.end()].isdigit():
@@ -243,8 +364,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
                 })
     
     # HIPAA Identifier 2: Geographic subdivisions - Addresses
-    address_pattern = r'\b\d+\s+[A-Za-z\s]+(?:St|Street|Ave|Avenue|Rd|Road|Dr|Drive|Ln|Lane|Blvd|Boulevard|Way|Court|Ct|Plaza|Place|Pl)\.?\s*,?\s*[A-Za-z\s]+,?\s*[A-Z]{2}\s+\d{5}(?:-\d{4})?'
-    for match in re.finditer(address_pattern, text):
+    for match in _ADDRESS_RE.finditer(text):
         entities.append({
             'Type': 'ADDRESS',
             'originalData': match.group(),
@@ -254,13 +374,8 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # HIPAA Identifier 8: Medical Record Numbers
-    mrn_patterns = [
-        r'\b(?:MRN|mrn|Medical Record Number)[\s:#-]*([A-Z0-9-]+)\b',
-        r'\b(?:Patient ID|patient id)[\s:#-]*([A-Z0-9-]+)\b',
-        r'\b[A-Z]{2,4}-\d{6,10}\b'  # Common MRN format
-    ]
-    for pattern in mrn_patterns:
-        for match in re.finditer(pattern, text):
+    for pattern in _MRN_RES:
+        for match in pattern.finditer(text):
             entities.append({
                 'Type': 'MRN',
                 'originalData': match.group(),
@@ -270,13 +385,8 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
             })
     
     # HIPAA Identifier 9: Health plan beneficiary numbers
-    insurance_patterns = [
-        r'Insurance ID:\s*([A-Z0-9]+)',
-        r'\b(?:Member ID|Policy Number)[\s:#-]*([A-Z0-9-]+)\b',
-        r'\b[A-Z]{1,3}\d{6,12}\b'  # Common insurance ID format
-    ]
-    for pattern in insurance_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
+    for pattern in _INSURANCE_RES:
+        for match in pattern.finditer(text):
             # For the first two patterns, use group 1
             if match.lastindex:
                 entities.append({
@@ -299,8 +409,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
                     })
     
     # HIPAA Identifier 11: Certificate/License numbers
-    license_pattern = r'\b(?:License|Certificate)[\s#:]*([A-Z0-9-]+)\b'
-    for match in re.finditer(license_pattern, text, re.IGNORECASE):
+    for match in _LICENSE_RE.finditer(text):
         entities.append({
             'Type': 'LICENSE_NUMBER',
             'originalData': match.group(),
@@ -310,12 +419,8 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # HIPAA Identifier 12: Vehicle identifiers
-    vehicle_patterns = [
-        r'\b(?:License Plate|Plate)[\s:#]*([A-Z0-9-]+)\b',
-        r'\bVIN[\s:#]*([A-Z0-9]{17})\b'
-    ]
-    for pattern in vehicle_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
+    for pattern in _VEHICLE_RES:
+        for match in pattern.finditer(text):
             entities.append({
                 'Type': 'VEHICLE_ID',
                 'originalData': match.group(),
@@ -325,13 +430,8 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
             })
     
     # HIPAA Identifier 13: Device identifiers and serial numbers
-    device_patterns = [
-        r'\b(?:Serial Number|Serial|SN)[\s:#]*([A-Z0-9-]+)\b',
-        r'\b(?:Device ID|Device)[\s:#]*([A-Z0-9-]+)\b',
-        r'\b(?:Pacemaker|Pump|Implant)\s+(?:ID|Serial)[\s:#]*([A-Z0-9-]+)\b'
-    ]
-    for pattern in device_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
+    for pattern in _DEVICE_RES:
+        for match in pattern.finditer(text):
             entities.append({
                 'Type': 'DEVICE_ID',
                 'originalData': match.group(),
@@ -341,8 +441,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
             })
     
     # HIPAA Identifier 14: URLs
-    url_pattern = r'https?://[^\s]+'
-    for match in re.finditer(url_pattern, text):
+    for match in _URL_RE.finditer(text):
         entities.append({
             'Type': 'URL',
             'originalData': match.group(),
@@ -352,8 +451,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # HIPAA Identifier 15: IP addresses
-    ip_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
-    for match in re.finditer(ip_pattern, text):
+    for match in _IP_RE.finditer(text):
         entities.append({
             'Type': 'IP_ADDRESS',
             'originalData': match.group(),
@@ -363,11 +461,8 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # HIPAA Identifier 16: Biometric identifiers
-    biometric_patterns = [
-        r'\b(?:Fingerprint|Retinal|Voiceprint|Facial Recognition)[\s:]*(ID)?[\s:#]*([A-Z0-9-]+)\b'
-    ]
-    for pattern in biometric_patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
+    for pattern in _BIOMETRIC_RES:
+        for match in pattern.finditer(text):
             entities.append({
                 'Type': 'BIOMETRIC_ID',
                 'originalData': match.group(),
@@ -378,8 +473,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
     
     # HIPAA Identifier 18: Any other unique identifying number
     # This includes clinical trial identifiers
-    trial_pattern = r'\bNCT\d{8}\b'
-    for match in re.finditer(trial_pattern, text):
+    for match in _TRIAL_RE.finditer(text):
         entities.append({
             'Type': 'CLINICAL_TRIAL_ID',
             'originalData': match.group(),
@@ -389,8 +483,7 @@ def detect_local_pii(text: str) -> List[Dict[str, Any]]:
         })
     
     # Employee IDs
-    employee_pattern = r'\b(?:Employee ID|EID)[\s:#]*([A-Z0-9-]+)\b'
-    for match in re.finditer(employee_pattern, text, re.IGNORECASE):
+    for match in _EMPLOYEE_RE.finditer(text):
         entities.append({
             'Type': 'EMPLOYEE_ID',
             'originalData': match.group(),
@@ -439,6 +532,10 @@ def generate_fake_data(entity_type: str) -> Tuple[str, str]:
     """
     if entity_type == 'NAME':
         return 'faker', fake.name()
+    elif entity_type == 'FIRST_NAME':
+        return 'faker', fake.first_name()
+    elif entity_type == 'LAST_NAME':
+        return 'faker', fake.last_name()
     elif entity_type == 'ADDRESS':
         return 'faker', fake.address().replace('\n', ' ')
     elif entity_type == 'PHONE_NUMBER':
@@ -493,23 +590,16 @@ def generate_fake_entities(masterid: str, entities: List[Dict], existing_records
     Generate fake data for detected entities, checking existing records first.
     """
     new_records = []
-    
+
+    # Key existing fakes by (TYPE, ORIGINALDATA) so each entity is an O(1) lookup
+    known = {}
+    for record in existing_records:
+        known.setdefault((record['piiType'].upper(), record['originalData'].upper()), record['fakeData'])
+
     for entity in entities:
-        # Check if we already have fake data for this entity
-        fake_data = None
-        for record in existing_records:
-            if (record['piiType'].upper() == entity['Type'].upper() and 
-                record['originalData'].upper() == entity['originalData'].upper()):
-                fake_data = record['fakeData']
-                break
-        
-        # Check in new records too
-        if not fake_data:
-            for record in new_records:
-                if (record['piiType'].upper() == entity['Type'].upper() and 
-                    record['originalData'].upper() == entity['originalData'].upper()):
-                    fake_data = record['fakeData']
-                    break
+        # Check existing and newly generated records
+        key = (entity['Type'].upper(), entity['originalData'].upper())
+        fake_data = known.get(key)
         
         # Generate new fake data if needed
         if not fake_data:
@@ -525,6 +615,7 @@ def generate_fake_entities(masterid: str, entities: List[Dict], existing_records
                 'fakeDataType': generator_name,
                 'fakeData': fake_data
             })
+            known.setdefault(key, fake_data)
     
     return new_records
 
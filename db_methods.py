@@ -6,7 +6,9 @@ Updated to only track HIPAA identifiers
 
 import uuid
 import json
+import time
 import logging
+import threading
 from datetime import datetime, timedelta
 from sqlalchemy import text
 
@@ -15,6 +17,31 @@ import db_utils
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Short-lived in-process cache of PII entity rows keyed by masterid.
+# Absorbs bursts of requests for the same user (e.g. warm Lambda containers);
+# entries are dropped whenever new entities are written for that masterid.
+PIIENTITY_CACHE_SIZE = 256
+PIIENTITY_CACHE_TTL = 60  # seconds
+
+# Max originals per existence check in bulk inserts (keeps under SQL variable limits)
+PIIENTITY_LOOKUP_BATCH_SIZE = 500
+# Max rows per multi-row INSERT (6 values per row, also under SQL variable limits)
+PIIENTITY_INSERT_BATCH_SIZE = 150
+
+_piientity_cache = {}
+_piientity_cache_lock = threading.Lock()
+# Bumped on every invalidation (per masterid, and the epoch for a full clear),
+# so a read that raced a write never stores its stale rows in the cache
+_piientity_generation = {}
+_piientity_cache_epoch = 0
+
+# Identity -> master UUID mappings never change once created, so they are
+# cached without expiry (bounded, oldest evicted first).
+PIIMASTER_CACHE_SIZE = 1024
+
+_piimaster_cache = {}
+_piimaster_cache_lock = threading.Lock()
+
 
 def get_piimaster_uuid(identity, identityType, insert=True):
     """
@@ -28,6 +55,23 @@ def get_piimaster_uuid(identity, identityType, insert=True):
     Returns:
         The master UUID string
     """
+    cache_key = (identity, identityType)
+    with _piimaster_cache_lock:
+        master_uuid = _piimaster_cache.get(cache_key)
+    if master_uuid:
+        return master_uuid
+    
+    master_uuid = _fetch_piimaster_uuid(identity, identityType, insert)
+    if master_uuid:
+        with _piimaster_cache_lock:
+            if len(_piimaster_cache) >= PIIMASTER_CACHE_SIZE:
+                _piimaster_cache.pop(next(iter(_piimaster_cache)))
+            _piimaster_cache[cache_key] = master_uuid
+    return master_uuid
+
+
+def _fetch_piimaster_uuid(identity, identityType, insert):
+    """Look up, and optionally create, the master UUID in the database"""
     session = db_utils.get_db_session()
     try:
         # Check if identity already exists
@@ -63,16 +107,65 @@ def get_piimaster_uuid(identity, identityType, insert=True):
         session.close()
 
 
-def get_piientity_data(masterid):
+def get_piientity_data(masterid, use_cache=True):
     """
     Get all PII entity mappings for a master ID.
+    Results are served from a short-lived in-process cache when available.
     
     Args:
         masterid: The master UUID
+        use_cache: Set to False to always read the database, e.g. before
+            creating new mappings that must not duplicate stored ones
     
     Returns:
         List of dictionaries with PII mappings
     """
+    now = time.monotonic()
+    with _piientity_cache_lock:
+        if use_cache:
+            cached = _piientity_cache.get(masterid)
+            if cached and cached[0] > now:
+                return cached[1]
+        generation = (_piientity_cache_epoch, _piientity_generation.get(masterid, 0))
+
+    rows = _fetch_piientity_data(masterid)
+    if rows is None:
+        return []
+
+    with _piientity_cache_lock:
+        # Rows written and invalidated during the fetch may be missing here
+        if generation != (_piientity_cache_epoch, _piientity_generation.get(masterid, 0)):
+            return rows
+        if len(_piientity_cache) >= PIIENTITY_CACHE_SIZE:
+            # Evict the oldest entry (dicts keep insertion order)
+            _piientity_cache.pop(next(iter(_piientity_cache)))
+        _piientity_cache[masterid] = (now + PIIENTITY_CACHE_TTL, rows)
+    return rows
+
+
+def invalidate_piientity_cache(masterid=None):
+    """
+    Drop cached PII entity rows for a master ID, or all of them.
+    
+    Args:
+        masterid: The master UUID, or None to clear the whole cache
+    """
+    global _piientity_cache_epoch
+    with _piientity_cache_lock:
+        if masterid is None:
+            _piientity_cache.clear()
+            _piientity_generation.clear()
+            _piientity_cache_epoch += 1
+        else:
+            _piientity_cache.pop(masterid, None)
+            _piientity_generation[masterid] = _piientity_generation.get(masterid, 0) + 1
+
+
+def _fetch_piientity_data(masterid):
+    """
+    Load all PII entity mappings for a master ID from the database.
+    Returns None if the query failed, so failures are never cached.
+    """
     session = db_utils.get_db_session()
     try:
         query = """
@@ -95,7 +188,7 @@ def get_piientity_data(masterid):
         
     except Exception as e:
         logger.error(f"Error in get_piientity_data: {e}")
-        return []
+        return None
     finally:
         session.close()
 
@@ -109,28 +202,13 @@ def bulk_insert_piientity(records):
     """
     session = db_utils.get_db_session()
     try:
-        for record in records:
-            # Check if record already exists
-            check_query = """
-                SELECT COUNT(*) as count FROM PIIEntity
-                WHERE uuid = %s AND piiType = %s AND originalData = %s
-            """
-            result = session.execute(check_query, 
-                                   (record['uuid'], record['piiType'], record['originalData']))
-            
-            if result.fetchone()['count'] == 0:
-                # Insert new record
-                insert_query = """
-                    INSERT INTO PIIEntity (uuid, piiType, originalData, fakeDataType, fakeData, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """
-                session.execute(insert_query,
-                              (record['uuid'], record['piiType'], record['originalData'],
-                               record['fakeDataType'], record['fakeData'], datetime.utcnow()))
-        
+        _insert_piientity_records(session, records)
         session.commit()
         logger.info(f"Successfully inserted {len(records)} PII entity records")
         
+        for masterid in {record['uuid'] for record in records}:
+            invalidate_piientity_cache(masterid)
+        
     except Exception as e:
         session.rollback()
         logger.error(f"Error in bulk_insert_piientity: {e}")
@@ -139,6 +217,80 @@ def bulk_insert_piientity(records):
         session.close()
 
 
+def _insert_piientity_records(session, records):
+    """
+    Insert the PII entity records that are not stored yet, without committing.
+    Existing mappings are looked up in batches per master ID and the new ones
+    are written with multi-row INSERT statements.
+    """
+    # First record wins for duplicate keys within the batch
+    pending = {}
+    for record in records:
+        pending.setdefault((record['uuid'], record['piiType'], record['originalData']), record)
+    
+    originals_by_uuid = {}
+    for masterid, _, original in pending:
+        originals_by_uuid.setdefault(masterid, []).append(original)
+    
+    for masterid, originals in originals_by_uuid.items():
+        for start in range(0, len(originals), PIIENTITY_LOOKUP_BATCH_SIZE):
+            batch = originals[start:start + PIIENTITY_LOOKUP_BATCH_SIZE]
+            check_query = f"""
+                SELECT piiType, originalData FROM PIIEntity
+                WHERE uuid = %s AND originalData IN ({', '.join(['%s'] * len(batch))})
+            """
+            result = session.execute(check_query, (masterid, *batch))
+            for row in result:
+                pending.pop((masterid, row['piiType'], row['originalData']), None)
+    
+    if pending:
+        created_at = datetime.utcnow()
+        new_records = list(pending.values())
+        for start in range(0, len(new_records), PIIENTITY_INSERT_BATCH_SIZE):
+            batch = new_records[start:start + PIIENTITY_INSERT_BATCH_SIZE]
+            insert_query = f"""
+                INSERT INTO PIIEntity (uuid, piiType, originalData, fakeDataType, fakeData, created_at)
+                VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(batch))}
+            """
+            params = []
+            for record in batch:
+                params.extend((record['uuid'], record['piiType'], record['originalData'],
+                               record['fakeDataType'], record['fakeData'], created_at))
+            session.execute(insert_query, params)
+
+
+def save_anonymization(records, masterid, original, anonymized, method, metadata=None):
+    """
+    Store new PII entity mappings and the operation record in one transaction.
+    
+    Args:
+        records: List of dictionaries with PII entity data (may be empty)
+        masterid: The master UUID
+        original: Original data
+        anonymized: Anonymized data
+        method: The method used (ANONYMIZE, ANONYMIZE_JSON_SIMPLE, etc.)
+        metadata: Additional metadata as JSON string
+    """
+    session = db_utils.get_db_session()
+    try:
+        if records:
+            _insert_piientity_records(session, records)
+        _insert_piidata_row(session, masterid, original, anonymized, method, metadata)
+        session.commit()
+        
+        if records:
+            logger.info(f"Successfully inserted {len(records)} PII entity records")
+            for record_uuid in {record['uuid'] for record in records}:
+                invalidate_piientity_cache(record_uuid)
+        
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error in save_anonymization: {e}")
+        raise
+    finally:
+        session.close()
+
+
 def insert_piidata(masterid, original, anonymized, method, metadata=None):
     """
     Insert a record of anonymization/de-anonymization operation.
@@ -152,12 +304,7 @@ def insert_piidata(masterid, original, anonymized, method, metadata=None):
     """
     session = db_utils.get_db_session()
     try:
-        insert_query = """
-            INSERT INTO PIIData (uuid, originalData, anonymizedData, method, metadata, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        session.execute(insert_query,
-                      (masterid, original, anonymized, method, metadata, datetime.utcnow()))
+        _insert_piidata_row(session, masterid, original, anonymized, method, metadata)
         session.commit()
         
     except Exception as e:
@@ -168,6 +315,16 @@ def insert_piidata(masterid, original, anonymized, method, metadata=None):
         session.close()
 
 
+def _insert_piidata_row(session, masterid, original, anonymized, method, metadata):
+    """Insert one PIIData operation record, without committing"""
+    insert_query = """
+        INSERT INTO PIIData (uuid, originalData, anonymizedData, method, metadata, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    session.execute(insert_query,
+                  (masterid, original, anonymized, method, metadata, datetime.utcnow()))
+
+
 def get_anonymization_statistics(masterid=None):
     """
     Get anonymization statistics for a user or globally.
@@ -297,6 +454,7 @@ def cleanup_old_records(days=90):
         entity_deleted = result.rowcount
         
         session.commit()
+        invalidate_piientity_cache()
         
         return {
             'data_records_deleted': data_deleted,
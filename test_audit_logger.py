@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the background audit logger
+Covers that flush() writes every queued entry, in order
+"""
+
+import logging
+
+import audit_logger
+from audit_logger import AsyncAuditLogger
+
+
+class _CaptureHandler(logging.Handler):
+    """Collects the entries tagged with this test's marker"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if '"audit-test"' in message:
+            self.messages.append(message)
+
+
+def _capture_audit_log():
+    handler = _CaptureHandler()
+    audit_logger.logger.addHandler(handler)
+    audit_logger.logger.setLevel(logging.INFO)
+    return handler
+
+
+def test_flush_writes_every_entry_in_order():
+    """All entries logged before flush() are written once it returns"""
+    handler = _capture_audit_log()
+    try:
+        audit = AsyncAuditLogger(batch_size=8)
+        for i in range(100):
+            audit.log_access({'test': 'audit-test', 'n': i})
+        audit.log_error({'test': 'audit-test', 'n': 100})
+        audit.flush()
+    finally:
+        audit_logger.logger.removeHandler(handler)
+    assert len(handler.messages) == 101
+    assert all(message.startswith('AUDIT: ') for message in handler.messages)
+    assert '"n": 0}' in handler.messages[0] and '"ACCESS"' in handler.messages[0]
+    assert '"n": 100}' in handler.messages[-1] and '"ERROR"' in handler.messages[-1]
+
+
+def test_full_queue_writes_inline():
+    """Entries that do not fit in the queue are written rather than dropped"""
+    handler = _capture_audit_log()
+    try:
+        audit = AsyncAuditLogger(max_queue_size=1)
+        for i in range(50):
+            audit.log_success({'test': 'audit-test', 'n': i})
+        audit.flush()
+    finally:
+        audit_logger.logger.removeHandler(handler)
+    assert len(handler.messages) == 50
+
+
+if __name__ == "__main__":
+    test_flush_writes_every_entry_in_order()
+    test_full_queue_writes_inline()
+    print("All audit logger tests passed")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the PII entity storage in db_methods
+Covers the entity cache and the batched entity inserts
+"""
+
+import uuid
+
+import db_methods
+from db_methods import bulk_insert_piientity, get_piientity_data, get_piimaster_uuid, invalidate_piientity_cache
+
+
+def _new_masterid():
+    return get_piimaster_uuid(f"db-test-{uuid.uuid4()}@example.com", 'email')
+
+
+def _record(masterid, original, fake):
+    return {
+        'uuid': masterid,
+        'piiType': 'NAME',
+        'originalData': original,
+        'fakeDataType': 'faker',
+        'fakeData': fake,
+    }
+
+
+def test_cache_skips_rows_read_during_a_write():
+    """Rows fetched while the masterid was invalidated are not cached"""
+    masterid = _new_masterid()
+    fetch = db_methods._fetch_piientity_data
+
+    def racing_fetch(racing_masterid):
+        stale = fetch(racing_masterid)
+        bulk_insert_piientity([_record(masterid, 'Alice Smith', 'Carol White')])
+        return stale
+
+    db_methods._fetch_piientity_data = racing_fetch
+    try:
+        assert get_piientity_data(masterid) == []
+    finally:
+        db_methods._fetch_piientity_data = fetch
+    assert [row['fakeData'] for row in get_piientity_data(masterid)] == ['Carol White']
+
+
+def test_uncached_read_sees_new_rows():
+    """use_cache=False reads rows the cache has not seen yet"""
+    masterid = _new_masterid()
+    assert get_piientity_data(masterid) == []
+    session = db_methods.db_utils.get_db_session()
+    try:
+        db_methods._insert_piientity_records(session, [_record(masterid, 'Alice Smith', 'Carol White')])
+        session.commit()
+    finally:
+        session.close()
+    assert get_piientity_data(masterid) == []
+    assert len(get_piientity_data(masterid, use_cache=False)) == 1
+    invalidate_piientity_cache(masterid)
+
+
+def test_bulk_insert_across_batch_boundaries():
+    """Inserts and existence checks split into batches without losing or duplicating rows"""
+    masterid = _new_masterid()
+    first = db_methods.PIIENTITY_INSERT_BATCH_SIZE + 10
+    total = db_methods.PIIENTITY_LOOKUP_BATCH_SIZE + 20
+    bulk_insert_piientity([_record(masterid, f"Original {i}", f"Fake {i}") for i in range(first)])
+
+    # Overlaps the stored rows and repeats one new original with another fake
+    records = [_record(masterid, f"Original {i}", f"Other {i}") for i in range(total)]
+    records.append(_record(masterid, f"Original {total - 1}", 'Duplicate'))
+    bulk_insert_piientity(records)
+
+    fakes = {row['originalData']: row['fakeData'] for row in get_piientity_data(masterid, use_cache=False)}
+    assert len(fakes) == total
+    assert fakes['Original 0'] == 'Fake 0'
+    assert fakes[f"Original {first - 1}"] == f"Fake {first - 1}"
+    assert fakes[f"Original {first}"] == f"Other {first}"
+    assert fakes[f"Original {total - 1}"] == f"Other {total - 1}"
+
+
+if __name__ == "__main__":
+    test_cache_skips_rows_read_during_a_write()
+    test_uncached_read_sees_new_rows()
+    test_bulk_insert_across_batch_boundaries()
+    print("All db_methods tests passed")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Regression tests for JSON anonymization and de-anonymization
+Covers the entity substitution, the JSON walk and the anonymize -> de-anonymize round trip
+"""
+
+import json
+import math
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from anonymizer import (_replace_all, _json_dumps, _json_loads, _json_parse, _compile_fake_pattern, _de_anonymize_json_recursive_ordered,
+                        _anonymize_json_recursive_ordered, build_fake_to_original, build_pii_index,
+                        anonymize_json, de_anonymize_json)
+
+# PII rows where one fake is a common word prefix and one is a ZIP mask
+DE_ANONYMIZE_ROWS = [
+    {'piiType': 'NAME', 'fakeData': 'Ann', 'originalData': 'Jennifer', 'fakeDataType': 'faker'},
+    {'piiType': 'ZIP', 'fakeData': '00000', 'originalData': '03601', 'fakeDataType': 'HIPAA_ZIP_Handler'},
+    {'piiType': 'NAME', 'fakeData': 'Ann Lee', 'originalData': 'Jennifer Smith', 'fakeDataType': 'faker'},
+    {'piiType': 'PHONE_NUMBER', 'fakeData': '555-010-1234', 'originalData': '617-555-0199', 'fakeDataType': 'faker'},
+]
+
+
+def test_replace_all_does_not_rereplace_fakes():
+    """A fake that contains another original must not be substituted again"""
+    replacements = {'Mary Jones': 'John Carter', 'John': 'Paul'}
+    assert _replace_all('Mary Jones met John', replacements) == 'John Carter met Paul'
+
+
+def test_replace_all_single_pair():
+    """One pair replaces every occurrence"""
+    assert _replace_all('John and John', {'John': 'Paul'}) == 'Paul and Paul'
+
+
+def test_walk_records_each_new_mapping_once():
+    """The walk keeps structure and order and records every new entity once"""
+    data = {
+        'note': 'Contact john.doe@example.com',
+        'contacts': ['john.doe@example.com', {'email': 'jane@example.org', 'score': 42}],
+        'visits': [1, 2.5, None, True],
+    }
+    anonymized, records = _anonymize_json_recursive_ordered(data, 'walk-test', build_pii_index([]))
+    assert list(anonymized) == ['note', 'contacts', 'visits']
+    assert anonymized['visits'] == [1, 2.5, None, True]
+    assert anonymized['contacts'][1]['score'] == 42
+    assert [(r['piiType'], r['originalData']) for r in records] == [
+        ('EMAIL', 'john.doe@example.com'), ('EMAIL', 'jane@example.org')]
+    fakes = {r['originalData']: r['fakeData'] for r in records}
+    assert anonymized['note'] == 'Contact ' + fakes['john.doe@example.com']
+    assert anonymized['contacts'][0] == fakes['john.doe@example.com']
+    assert anonymized['contacts'][1]['email'] == fakes['jane@example.org']
+
+
+def test_walk_reuses_stored_mappings():
+    """Entities already stored are replaced with their fake and not recorded again"""
+    rows = [{'piiType': 'EMAIL', 'originalData': 'john.doe@example.com',
+             'fakeDataType': 'faker', 'fakeData': 'stored@example.net'}]
+    anonymized, records = _anonymize_json_recursive_ordered(
+        {'email': 'john.doe@example.com'}, 'walk-test', build_pii_index(rows))
+    assert anonymized == {'email': 'stored@example.net'}
+    assert records == []
+
+
+def test_json_round_trip_keeps_non_finite_floats():
+    """NaN and Infinity survive serialization instead of becoming null"""
+    data = {'a': float('nan'), 'b': [float('inf'), -float('inf')], 'c': 1.5}
+    text = _json_dumps(data)
+    assert 'null' not in text
+    parsed = _json_loads(text)
+    assert math.isnan(parsed['a'])
+    assert parsed['b'] == [float('inf'), -float('inf')]
+    assert parsed['c'] == 1.5
+
+
+def test_json_parse_reports_non_finite_input():
+    """Only input the stdlib had to parse is treated as possibly non-finite"""
+    data, finite = _json_parse('{"a": NaN, "b": 1}')
+    assert math.isnan(data['a']) and not finite
+    assert _json_parse('{"a": 1.5}') == ({'a': 1.5}, orjson is not None)
+
+
+def test_anonymize_json_string_keeps_nan():
+    """A NaN in a JSON string payload survives anonymization"""
+    identity = f"nan-{uuid.uuid4()}@example.com"
+    body = anonymize_json(identity, 'email', '{"score": NaN, "note": "ok"}')['body']
+    result = json.loads(body)['result']
+    assert math.isnan(result['score']) and result['note'] == 'ok'
+
+
+def _restore(data, rows):
+    count = [0]
+    restored = _de_anonymize_json_recursive_ordered(
+        data, build_fake_to_original(rows), count, _compile_fake_pattern(rows))
+    return restored, count[0]
+
+
+def test_de_anonymize_leaves_partial_words_alone():
+    """Fakes inside longer words or numbers, and masks, are not restored"""
+    data = {'note': 'Annual checkup, dose 1000000 units'}
+    assert _restore(data, DE_ANONYMIZE_ROWS) == (data, 0)
+
+
+def test_de_anonymize_leaves_single_word_names_in_text():
+    """One-word name fakes are restored as whole values but not inside free text"""
+    rows = [
+        {'piiType': 'NAME', 'fakeData': 'Park', 'originalData': 'Whitfield', 'fakeDataType': 'faker'},
+        {'piiType': 'NAME', 'fakeData': 'Young', 'originalData': 'Zebedee', 'fakeDataType': 'faker'},
+    ]
+    data = {'note': 'walked in the Park', 'age': 'Young adult', 'last_name': 'Park'}
+    restored, count = _restore(data, rows)
+    assert restored == {'note': 'walked in the Park', 'age': 'Young adult', 'last_name': 'Whitfield'}
+    assert count == 1
+
+
+def test_de_anonymize_restores_whole_word_fakes():
+    """A fake embedded in a string as a whole word is restored"""
+    restored, count = _restore({'note': 'Ann Lee called from 555-010-1234.'}, DE_ANONYMIZE_ROWS)
+    assert restored == {'note': 'Jennifer Smith called from 617-555-0199.'}
+    assert count == 2
+
+
+def test_de_anonymize_exact_match_restores_mask():
+    """A value that is exactly a fake is restored, masks included"""
+    restored, count = _restore({'zip': '00000', 'name': 'Ann'}, DE_ANONYMIZE_ROWS)
+    assert restored == {'zip': '03601', 'name': 'Jennifer'}
+    assert count == 2
+
+
+def test_anonymize_json_round_trip():
+    """De-anonymizing anonymized JSON gives back the original"""
+    identity = f"roundtrip-{uuid.uuid4()}@example.com"
+    original = {'patient': {'email': identity, 'phone': '555-123-4567'}, 'visits': [1, 2]}
+    anonymized = json.loads(anonymize_json(identity, 'email', original)['body'])['result']
+    assert anonymized['patient']['email'] != identity
+    assert anonymized['visits'] == [1, 2]
+    restored = json.loads(de_anonymize_json(identity, 'email', anonymized)['body'])['result']
+    assert restored == original
+
+
+if __name__ == "__main__":
+    test_replace_all_does_not_rereplace_fakes()
+    test_replace_all_single_pair()
+    test_walk_records_each_new_mapping_once()
+    test_walk_reuses_stored_mappings()
+    test_json_round_trip_keeps_non_finite_floats()
+    test_json_parse_reports_non_finite_input()
+    test_anonymize_json_string_keeps_nan()
+    test_de_anonymize_leaves_partial_words_alone()
+    test_de_anonymize_leaves_single_word_names_in_text()
+    test_de_anonymize_restores_whole_word_fakes()
+    test_de_anonymize_exact_match_restores_mask()
+    test_anonymize_json_round_trip()
+    print("All JSON anonymization tests passed")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for PII detection fallbacks
+Covers how Comprehend failures degrade to local detection
+"""
+
+from botocore.exceptions import NoCredentialsError
+
+import comprehend
+from comprehend import detect_pii_data
+
+
+class _FlakyComprehend:
+    """Comprehend client whose first call fails to find credentials"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def detect_pii_entities(self, Text, LanguageCode):
+        self.calls += 1
+        if self.calls == 1:
+            raise NoCredentialsError()
+        return {'Entities': [{'Type': 'NAME', 'BeginOffset': 0, 'EndOffset': 5, 'Score': 0.99}]}
+
+
+def test_missing_credentials_are_retried():
+    """A credentials failure is not cached and does not disable Comprehend"""
+    client = _FlakyComprehend()
+    original_client = comprehend.comprehend_client
+    comprehend.comprehend_client = client
+    try:
+        text = "alice visited the clinic twice"
+        assert [e['Type'] for e in detect_pii_data(text)] == []
+        assert [e['originalData'] for e in detect_pii_data(text)] == ['alice']
+        assert comprehend.comprehend_client is client
+        assert client.calls == 2
+    finally:
+        comprehend.comprehend_client = original_client
+
+
+if __name__ == "__main__":
+    test_missing_credentials_are_retried()
+    print("All PII detection tests passed")
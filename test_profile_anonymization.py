@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for profile anonymization
+Covers the HIPAA field handling and how lambda_handler parses PROFILE
+"""
+
+import ast
+import json
+import uuid
+
+from anonymizer import anonymize_profile, lambda_handler
+
+
+def _unique_identity():
+    return f"profile-{uuid.uuid4()}@example.com"
+
+
+def _profile_result(response):
+    assert response['statusCode'] == 200
+    return ast.literal_eval(json.loads(response['body'])['result'])
+
+
+def test_dob_keeps_only_the_year():
+    """Dates of birth are masked down to the year, whatever the layout"""
+    profile = {'DOB': '03/15/1980', 'Date of Birth': '1975-02-01', 'dob_note': 'unknown'}
+    result = _profile_result(anonymize_profile(_unique_identity(), 'EMAIL', profile))
+    assert result == {'DOB': 'XX/XX/1980', 'Date of Birth': 'XX/XX/1975', 'dob_note': 'XX/XX/XXXX'}
+
+
+def test_first_and_last_names_generated_separately():
+    """First and last name fields get a single fake name part each"""
+    profile = {'First Name': 'Zebedee', 'Last Name': 'Quillfeather', 'Provider Name': 'Dr. Adams'}
+    result = _profile_result(anonymize_profile(_unique_identity(), 'EMAIL', profile))
+    assert result['First Name'] != 'Zebedee' and ' ' not in result['First Name']
+    assert result['Last Name'] != 'Quillfeather' and ' ' not in result['Last Name']
+    assert result['Provider Name'] == 'Dr. Adams'
+
+
+def _profile_event(profile):
+    return {'body': json.dumps({
+        'method': 'ANONYMIZE',
+        'identity': _unique_identity(),
+        'identityType': 'EMAIL',
+        'profile': profile,
+    })}
+
+
+def test_lambda_handler_parses_profile():
+    """PROFILE is accepted as an object, a JSON string or a Python literal string"""
+    for profile in ({'DOB': '03/15/1980'}, '{"DOB": "03/15/1980"}', "{'DOB': '03/15/1980'}"):
+        assert _profile_result(lambda_handler(_profile_event(profile), None)) == {'DOB': 'XX/XX/1980'}
+
+
+if __name__ == "__main__":
+    test_dob_keeps_only_the_year()
+    test_first_and_last_names_generated_separately()
+    test_lambda_handler_parses_profile()
+    print("All profile anonymization tests passed")